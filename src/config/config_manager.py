@@ -63,7 +63,16 @@ class ConfigManager:
                     "first_shown": False,
                     "enabled": False,
                     "port": 9999,
-                    "host": "192.168.96.111"
+                    "host": "192.168.96.111",
+                    "batch_size": 100,
+                    "deflate_level": 6,
+                    "compress_workers": 0,
+                    "engine": "flask",
+                    "delta_threshold": 1048576,
+                    "download_workers": 4,
+                    "backup_keep_last": 5,
+                    "backup_keep_daily": 7,
+                    "backup_keep_weekly": 4
                 }
                 }
         self.config = self.load_config()
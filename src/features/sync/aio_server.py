@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync aiohttp Engine
+Asyncio HTTP engine serving the SyncServer routes to many LAN clients at once
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+
+from aiohttp import web
+from aiohttp.helpers import ETag
+from aiohttp.web_log import AccessLogger
+
+from features.sync.delta import iter_delta_frames
+from features.sync.framing import FRAMES_MIMETYPE
+from features.sync.metrics import METRICS_MIMETYPE, SyncMetrics
+from features.sync.server import MANIFEST_NDJSON_MIMETYPE
+
+
+METRICS_KEY = web.AppKey('sync_metrics', SyncMetrics)
+SERVER_KEY = web.AppKey('sync_server', object)
+
+
+class _MetricsAccessLogger(AccessLogger):
+    """Access logger that also records each finished request in the server metrics"""
+
+    @property
+    def enabled(self):
+        # Metrics are recorded even when the access log itself is silenced
+        return True
+
+    def log(self, request, response, time):
+        if self.logger.isEnabledFor(logging.INFO):
+            super().log(request, response, time)
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'other'
+        request.app[METRICS_KEY].request_finished(
+            route, request.method, response.status, time, response.body_length
+        )
+
+
+@web.middleware
+async def _active_requests_middleware(request, handler):
+    gauge = request.app[METRICS_KEY].active_requests
+    gauge.inc()
+    try:
+        return await handler(request)
+    finally:
+        gauge.dec()
+
+
+@web.middleware
+async def _select_user_middleware(request, handler):
+    server = request.app[SERVER_KEY]
+    handle = request.query.get('user') or server.default_user
+    if handle not in server._users:
+        # Listing the data root and opening the index block, keep them off the event loop
+        error = await asyncio.get_running_loop().run_in_executor(None, server._load_user, handle)
+        if error:
+            return web.json_response({'success': False, 'error': error}, status=404)
+    # The choice lives in the task's context and is copied into executor calls by _run
+    server.select_user(handle)
+    return await handler(request)
+
+
+class AioSyncEngine:
+    """
+    aiohttp based alternative to the werkzeug development server
+
+    Route logic is shared with the Flask app through SyncServer helpers; this
+    class only adapts it to asyncio. Blocking work (index refresh, hashing,
+    compression, file reads) runs in the default executor so one slow client
+    never stalls the event loop.
+
+    Exposes ``serve_forever()`` / ``shutdown()`` like a werkzeug server, so it
+    can be stored in ``SyncServer.httpd`` and stopped the same way.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, sync_server, host=None, port=None):
+        """
+        Initialize aiohttp engine
+
+        Args:
+            sync_server: SyncServer providing data path, index and route logic
+            host (str): Listen address (default: sync_server.host)
+            port (int): Listen port (default: sync_server.port)
+        """
+        self.sync_server = sync_server
+        self.host = host or sync_server.host
+        self.port = port or sync_server.port
+        self._loop = None
+        self._runner = None
+        self._started = threading.Event()
+        self._changes_event = None
+
+    def make_app(self):
+        """Build the aiohttp application"""
+        app = web.Application(middlewares=[_active_requests_middleware, _select_user_middleware])
+        app[METRICS_KEY] = self.sync_server.metrics
+        app[SERVER_KEY] = self.sync_server
+        app.router.add_get('/users', self.get_users)
+        app.router.add_get('/health', self.health_check)
+        app.router.add_get('/manifest', self.get_manifest)
+        app.router.add_get('/zip', self.get_zip)
+        app.router.add_get('/file', self.get_file)
+        app.router.add_get('/changes', self.get_changes)
+        app.router.add_get('/events', self.get_events)
+        app.router.add_get('/tree', self.get_tree)
+        app.router.add_get('/tail', self.get_tail)
+        app.router.add_post('/files', self.get_files)
+        app.router.add_post('/delta', self.get_delta)
+        app.router.add_get('/info', self.get_info)
+        app.router.add_get('/metrics', self.get_metrics)
+        return app
+
+    def serve_forever(self):
+        """Run the event loop in the calling thread until shutdown() is called"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._changes_event = asyncio.Event()
+
+        def on_changes():
+            loop.call_soon_threadsafe(self._wake_event_listeners)
+
+        with self.sync_server._changes_cond:
+            self.sync_server._change_callbacks.append(on_changes)
+        try:
+            self._runner = web.AppRunner(self.make_app(), access_log_class=_MetricsAccessLogger)
+            loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, self.host, self.port)
+            loop.run_until_complete(site.start())
+            self._started.set()
+            loop.run_forever()
+        finally:
+            with self.sync_server._changes_cond:
+                self.sync_server._change_callbacks.remove(on_changes)
+            self._started.set()
+            if self._runner is not None:
+                loop.run_until_complete(self._runner.cleanup())
+            loop.close()
+            self._loop = None
+
+    def shutdown(self):
+        """Stop serving, callable from any thread"""
+        self._started.wait(timeout=5.0)
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(loop.stop)
+
+    async def _run(self, func, *args):
+        # Executor threads don't inherit the context, which holds the selected user
+        call = functools.partial(contextvars.copy_context().run, func, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    def _error(self, message, status):
+        return web.json_response({'success': False, 'error': message}, status=status)
+
+    async def _stream(self, request, response, iterable):
+        """Write a blocking iterable to a prepared response, advancing it in the executor"""
+        iterator = iter(iterable)
+        try:
+            await response.prepare(request)
+            while True:
+                chunk = await self._run(next, iterator, None)
+                if chunk is None:
+                    break
+                await response.write(chunk)
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client went away, nothing left to send
+            pass
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close:
+                try:
+                    close()
+                except ValueError:
+                    # Still running in the executor after a cancelled request
+                    pass
+        return response
+
+    async def health_check(self, request):
+        """Health check endpoint"""
+        return web.json_response(self.sync_server._health_payload())
+
+    async def get_info(self, request):
+        """Get server information"""
+        return web.json_response(await self._run(self.sync_server._info_payload))
+
+    async def get_users(self, request):
+        """List the users that can be synced"""
+        return web.json_response(await self._run(self.sync_server._users_payload))
+
+    async def get_metrics(self, request):
+        """Request, cache and build metrics in the Prometheus text format"""
+        body = await self._run(self.sync_server.metrics.render)
+        return web.Response(body=body.encode('utf-8'), headers={'Content-Type': METRICS_MIMETYPE})
+
+    async def get_manifest(self, request):
+        """Get file manifest (JSON or streamed NDJSON), honouring If-None-Match"""
+        server = self.sync_server
+        try:
+            with_hash = request.query.get('hashes') in ('1', 'true')
+            ndjson = request.query.get('format') == 'ndjson'
+            await self._run(server.index.refresh)
+            etag, weak = server._manifest_etag(with_hash, ndjson)
+            etag_value = ETag(value=etag, is_weak=weak)
+
+            if any(tag.value == etag for tag in request.if_none_match or ()):
+                response = web.Response(status=304)
+                response.etag = etag_value
+                return response
+
+            if ndjson:
+                page, error = server._parse_manifest_page(request.query.get('after'), request.query.get('limit'))
+                if error:
+                    return self._error(error, 400)
+            else:
+                body = await self._run(server._manifest_body, with_hash, etag)
+                response = web.Response(text=body, content_type='application/json')
+                response.etag = etag_value
+                return response
+        except Exception as e:
+            return self._error(str(e), 500)
+
+        response = web.StreamResponse(headers={'Content-Type': MANIFEST_NDJSON_MIMETYPE})
+        response.etag = etag_value
+        lines = (chunk.encode('utf-8') for chunk in server._iter_manifest_ndjson(with_hash, *page))
+        return await self._stream(request, response, lines)
+
+    async def get_zip(self, request):
+        """Get all data as ZIP (or ?format= tar), served from the shared snapshot of the current data version"""
+        server = self.sync_server
+        fmt = request.query.get('format', 'zip')
+        if fmt not in server._archive_formats():
+            return self._error(f'Unsupported archive format: {fmt}', 400)
+
+        try:
+            await self._run(server.index.refresh, True)
+            etag = server._archive_etag(fmt)
+            # Requests joining a running build wait on the loop, only the builder takes an executor thread
+            first = True
+            while True:
+                snapshot, build, owner = server._claim_archive_snapshot(etag, fmt, count_lookup=first)
+                if snapshot is not None:
+                    break
+                if owner:
+                    await self._run(server._run_archive_build, etag, fmt, build)
+                else:
+                    await asyncio.wrap_future(build)
+                first = False
+        except Exception as e:
+            return self._error(str(e), 500)
+
+        return await self._send_snapshot(request, snapshot, etag, fmt)
+
+    async def _send_snapshot(self, request, snapshot, etag, fmt='zip'):
+        """Serve an opened file, or a byte range of it, with an explicit strong ETag; closes the file"""
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in (value.strip().strip('"') for value in if_none_match.split(',')):
+            snapshot.close()
+            response = web.Response(status=304)
+            response.etag = ETag(value=etag)
+            return response
+
+        size = os.fstat(snapshot.fileno()).st_size
+        if_range = request.headers.get('If-Range')
+        partial = request.headers.get('Range') and (if_range is None or if_range.strip('"') == etag)
+        try:
+            byte_range = request.http_range if partial else slice(None, None)
+        except ValueError:
+            byte_range = slice(None, None)
+
+        start, stop = byte_range.start, byte_range.stop
+        if start is None and stop is None:
+            start, stop = 0, size
+            partial = False
+        elif start is None or start < 0:
+            # Suffix range: the last N bytes
+            start, stop = max(0, size + (start if start is not None else -stop)), size
+        else:
+            stop = size if stop is None else min(stop, size)
+
+        if start >= size or start >= stop:
+            snapshot.close()
+            return web.Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+        response = web.StreamResponse(status=206 if partial else 200, headers={
+            'Content-Type': self.sync_server._archive_mimetype(fmt),
+            'Content-Disposition': f'inline; filename=sillytavern_data.{fmt}',
+            'Accept-Ranges': 'bytes'
+        })
+        if partial:
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response.content_length = stop - start
+        response.etag = ETag(value=etag)
+
+        def read_range():
+            with snapshot as f:
+                f.seek(start)
+                remaining = stop - start
+                while remaining > 0:
+                    data = f.read(min(self.CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+
+        return await self._stream(request, response, read_range())
+
+    async def get_file(self, request):
+        """Get specific file, FileResponse handles Range / If-Range with non-blocking I/O"""
+        file_path = request.query.get('path')
+        if not file_path:
+            return self._error('Missing path parameter', 400)
+
+        full_path, error, status = await self._run(self.sync_server._resolve_file, file_path)
+        if error:
+            return self._error(error, status)
+        return web.FileResponse(full_path, chunk_size=self.CHUNK_SIZE)
+
+    async def get_changes(self, request):
+        """Get files changed since a journal cursor"""
+        query = request.query
+        try:
+            payload, error = await self._run(
+                self.sync_server._changes_payload, query.get('since'), query.get('journal'),
+                query.get('hashes') in ('1', 'true')
+            )
+        except Exception as e:
+            return self._error(str(e), 500)
+        if error:
+            return self._error(error, 400)
+        return web.json_response(payload)
+
+    async def get_events(self, request):
+        """Server-Sent Events stream of change batches"""
+        since = request.headers.get('Last-Event-ID') or request.query.get('since')
+        try:
+            since = int(since)
+        except (TypeError, ValueError):
+            return self._error('Invalid since parameter', 400)
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        server = self.sync_server
+        journal_id = request.query.get('journal')
+        # Same protocol as SyncServer._iter_events, but listeners wait on the loop
+        # so they never hold an executor thread between changes
+        with server._changes_cond:
+            server._event_listeners += 1
+        try:
+            await response.prepare(request)
+            await response.write(b'retry: 3000\n\n')
+            cursor = since
+            while not server._refresh_stop.is_set():
+                # Taken before reading the journal, so a change signalled meanwhile is not missed
+                changed = self._changes_event
+                payload, _ = await self._run(server._changes_payload, cursor, journal_id, True)
+                if payload['reset']:
+                    await response.write(server._format_event('reset', payload, payload['cursor']).encode('utf-8'))
+                    break
+
+                if payload['changes']:
+                    cursor = payload['cursor']
+                    await response.write(server._format_event('changes', payload, cursor).encode('utf-8'))
+                    continue
+
+                try:
+                    await asyncio.wait_for(changed.wait(), server.EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    await response.write(b': keepalive\n\n')
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client went away, nothing left to send
+            pass
+        finally:
+            with server._changes_cond:
+                server._event_listeners -= 1
+        return response
+
+    def _wake_event_listeners(self):
+        """Release the /events listeners waiting on the current change event (loop thread)"""
+        self._changes_event.set()
+        self._changes_event = asyncio.Event()
+
+    async def get_tree(self, request):
+        """Get one directory level of the Merkle tree"""
+        try:
+            payload, error, status = await self._run(self.sync_server._tree_payload, request.query.get('path', ''))
+        except Exception as e:
+            return self._error(str(e), 500)
+        if error:
+            return self._error(error, status)
+        return web.json_response(payload)
+
+    async def get_tail(self, request):
+        """Get the bytes appended to a file since the client's copy"""
+        query = request.query
+        try:
+            tail, error, status = await self._run(
+                self.sync_server._open_tail, query.get('path'), query.get('offset'), query.get('prefix_hash')
+            )
+        except Exception as e:
+            return self._error(str(e), 500)
+        if error:
+            return self._error(error, status)
+
+        headers = self.sync_server._tail_headers(tail)
+        headers['Content-Type'] = 'application/octet-stream'
+        response = web.StreamResponse(headers=headers)
+        return await self._stream(request, response, self.sync_server._iter_tail(tail))
+
+    async def get_files(self, request):
+        """Get many files in one framed response"""
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+
+        paths, error = self.sync_server._parse_batch_request(data)
+        if error:
+            return self._error(error, 400)
+
+        response = web.StreamResponse(headers={'Content-Type': FRAMES_MIMETYPE})
+        return await self._stream(request, response, self.sync_server._iter_batch_frames(paths))
+
+    async def get_delta(self, request):
+        """Get a file as a delta against the client's copy"""
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+
+        delta, error = await self._run(self.sync_server._parse_delta_request, data)
+        if error:
+            return self._error(*error)
+
+        response = web.StreamResponse(headers={'Content-Type': FRAMES_MIMETYPE})
+        return await self._stream(request, response, iter_delta_frames(*delta))
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Backup
+Content-addressed, deduplicated snapshots of a data directory taken before a full sync
+
+Layout below the store root:
+    objects/<2 hex>/<hash>       file contents, one blob per unique content
+    snapshots/<snapshot id>.json snapshot manifests: path, size, mtime and hash of every file
+"""
+
+import os
+import re
+import json
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from features.sync.hashing import HASH_ALGORITHM, default_hash_workers, hash_files, new_hasher
+
+
+SNAPSHOT_TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+# Unreferenced blobs younger than this survive gc(), a snapshot being created may still need them
+GC_GRACE_PERIOD = 3600
+_COPY_CHUNK_SIZE = 1024 * 1024
+_SNAPSHOT_ID = re.compile(r'^(?P<name>.+)_(?P<stamp>\d{8}_\d{6})(_\d+)?$')
+
+
+@dataclass
+class RetentionPolicy:
+    """Which snapshots of a data directory BackupStore.prune() keeps"""
+
+    keep_last: int = 5  # newest snapshots, at least 1
+    keep_daily: int = 7  # newest snapshot of each of the last N days with snapshots
+    keep_weekly: int = 4  # newest snapshot of each of the last N ISO weeks with snapshots
+
+    def select(self, snapshots: List[Dict]) -> Set[str]:
+        """
+        Snapshots to keep
+
+        Args:
+            snapshots: Entries from BackupStore.list_snapshots() of one data directory
+
+        Returns:
+            set: Snapshot ids
+        """
+        newest_first = sorted(snapshots, key=lambda s: s['id'], reverse=True)
+        keep = {s['id'] for s in newest_first[:max(1, self.keep_last)]}
+        for count, bucket in ((self.keep_daily, lambda t: t.date()),
+                              (self.keep_weekly, lambda t: t.isocalendar()[:2])):
+            seen = set()
+            for snapshot in newest_first:
+                if len(seen) >= count:
+                    break
+                key = bucket(snapshot['created'])
+                if key not in seen:
+                    seen.add(key)
+                    keep.add(snapshot['id'])
+        return keep
+
+
+class BackupStore:
+    """
+    Deduplicated snapshot store
+
+    Every unique file content is stored once as a blob named by its hash, and
+    a snapshot is a manifest that maps paths to blobs, so storage only grows
+    with content no snapshot has seen before. A file whose size and mtime
+    match the previous snapshot of the same directory reuses its hash, the
+    others are hashed on a thread pool. Blobs are never modified, any
+    snapshot can be restored as long as its manifest exists, and gc()
+    removes blobs no manifest references.
+    """
+
+    def __init__(self, root: str, workers: Optional[int] = None):
+        """
+        Initialize backup store
+
+        Args:
+            root: Store directory
+            workers: Threads for hashing and copying (default: CPU count, at most 8)
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.snapshots_dir = os.path.join(root, 'snapshots')
+        self.workers = workers or default_hash_workers()
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    def _blob_path(self, file_hash: str) -> str:
+        return os.path.join(self.objects_dir, file_hash[:2], file_hash)
+
+    def _manifest_path(self, snapshot_id: str) -> str:
+        return os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+
+    def list_snapshots(self, name: Optional[str] = None) -> List[Dict]:
+        """
+        Snapshots in the store, oldest first
+
+        Args:
+            name: Only snapshots of this data directory name
+
+        Returns:
+            list: Dicts with ``id``, ``name`` and ``created`` (datetime)
+        """
+        snapshots = []
+        for file_name in os.listdir(self.snapshots_dir):
+            match = _SNAPSHOT_ID.match(file_name[:-5]) if file_name.endswith('.json') else None
+            if not match or (name is not None and match.group('name') != name):
+                continue
+            snapshots.append({
+                'id': file_name[:-5],
+                'name': match.group('name'),
+                'created': datetime.strptime(match.group('stamp'), SNAPSHOT_TIMESTAMP_FORMAT)
+            })
+        return sorted(snapshots, key=lambda s: s['id'])
+
+    def exists(self, snapshot_id: str) -> bool:
+        return os.path.exists(self._manifest_path(snapshot_id))
+
+    def load_manifest(self, snapshot_id: str) -> Dict:
+        """Manifest of a snapshot; ``files`` holds [path, size, mtime_ns, hash] rows"""
+        with open(self._manifest_path(snapshot_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _new_snapshot_id(self, name: str) -> str:
+        stamp = f"{name}_{datetime.now().strftime(SNAPSHOT_TIMESTAMP_FORMAT)}"
+        snapshot_id = stamp
+        suffix = 1
+        while self.exists(snapshot_id):
+            suffix += 1
+            snapshot_id = f"{stamp}_{suffix}"
+        return snapshot_id
+
+    def _touch_blob(self, file_hash: str) -> bool:
+        """Whether a blob exists; a fresh mtime keeps a concurrent gc() from removing it"""
+        try:
+            os.utime(self._blob_path(file_hash))
+            return True
+        except OSError:
+            return False
+
+    def _store_blob(self, full_path: str) -> Tuple[str, int]:
+        """
+        Copy a file into the store, hashing it on the way
+
+        Returns:
+            tuple: (hash of the copied content, bytes written, 0 if the blob already existed)
+        """
+        temp_path = os.path.join(self.objects_dir, f"{uuid.uuid4().hex}.tmp")
+        hasher = new_hasher()
+        size = 0
+        try:
+            with open(full_path, 'rb') as src, open(temp_path, 'wb') as dest:
+                for chunk in iter(lambda: src.read(_COPY_CHUNK_SIZE), b''):
+                    dest.write(chunk)
+                    hasher.update(chunk)
+                    size += len(chunk)
+            file_hash = hasher.hexdigest()
+            blob_path = self._blob_path(file_hash)
+            if self._touch_blob(file_hash):
+                os.remove(temp_path)
+                return file_hash, 0
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+            return file_hash, size
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def create(self, data_path: str, name: str) -> Tuple[str, int, int]:
+        """
+        Snapshot a data directory
+
+        Args:
+            data_path: Directory to back up
+            name: Data directory name, snapshot ids start with it
+
+        Returns:
+            tuple: (snapshot id, files with new content, bytes added to the store)
+        """
+        previous = {}
+        snapshots = self.list_snapshots(name)
+        if snapshots:
+            try:
+                manifest = self.load_manifest(snapshots[-1]['id'])
+                if manifest.get('hash_algorithm') == HASH_ALGORITHM:
+                    previous = {row[0]: row for row in manifest['files']}
+            except (OSError, ValueError, KeyError):
+                pass
+
+        rows = {}
+        pending = {}  # full path -> rel path
+        for root, _, files in os.walk(data_path):
+            for file_name in files:
+                full_path = os.path.join(root, file_name)
+                rel_path = os.path.relpath(full_path, data_path).replace(os.sep, '/')
+                try:
+                    stat_info = os.stat(full_path)
+                except OSError:
+                    continue
+                row = previous.get(rel_path)
+                if row and row[1] == stat_info.st_size and row[2] == stat_info.st_mtime_ns:
+                    rows[rel_path] = list(row)
+                else:
+                    rows[rel_path] = [rel_path, stat_info.st_size, stat_info.st_mtime_ns, None]
+                    pending[full_path] = rel_path
+
+        # Hash changed files in parallel, only content the store lacks is copied
+        for full_path, file_hash in hash_files(pending, self.workers).items():
+            rows[pending[full_path]][3] = file_hash
+        missing = [full_path for full_path, rel_path in pending.items()
+                   if rows[rel_path][3] is None or not self._touch_blob(rows[rel_path][3])]
+
+        def store(full_path):
+            try:
+                return full_path, self._store_blob(full_path)
+            except OSError:
+                return full_path, None
+
+        added_files = added_bytes = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for full_path, stored in pool.map(store, missing):
+                rel_path = pending[full_path]
+                if stored is None:
+                    # Vanished or unreadable, left out like the archives do
+                    del rows[rel_path]
+                    continue
+                # The file may have changed since it was hashed, the copy is what counts
+                rows[rel_path][3], written = stored
+                if written:
+                    added_files += 1
+                    added_bytes += written
+        for rel_path in [p for p, row in rows.items() if row[3] is None]:
+            del rows[rel_path]
+
+        with self._lock:
+            snapshot_id = self._new_snapshot_id(name)
+            manifest = {
+                'id': snapshot_id,
+                'name': name,
+                'created': datetime.now().isoformat(),
+                'source': os.path.abspath(data_path),
+                'hash_algorithm': HASH_ALGORITHM,
+                'files': [rows[path] for path in sorted(rows)]
+            }
+            manifest_path = self._manifest_path(snapshot_id)
+            with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(manifest_path + '.tmp', manifest_path)
+
+        return snapshot_id, added_files, added_bytes
+
+    def restore(self, snapshot_id: str, data_path: str):
+        """
+        Replace a data directory with the content of a snapshot
+
+        The files are rebuilt next to the data directory first, which is then
+        swapped in by renaming, so a failure leaves the data untouched. The
+        snapshot stays in the store.
+
+        Files whose size and mtime still match the snapshot are hard-linked
+        from the current data directory, so only files that changed since the
+        snapshot cost a copy. Blobs themselves are never linked: SillyTavern
+        and the sync client write data files in place, which would change
+        the stored content, and one blob can back paths with different mtimes.
+
+        Args:
+            snapshot_id: Snapshot to restore
+            data_path: Data directory to replace
+        """
+        manifest = self.load_manifest(snapshot_id)
+        data_path = data_path.rstrip('/\\')
+        stamp = datetime.now().strftime(SNAPSHOT_TIMESTAMP_FORMAT)
+        staging_path = f"{data_path}.restoring_{stamp}"
+        replaced_path = f"{data_path}.replaced_{stamp}"
+
+        try:
+            os.makedirs(staging_path)
+            for rel_path, size, mtime_ns, file_hash in manifest['files']:
+                parts = rel_path.split('/')
+                dest = os.path.join(staging_path, *parts)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                if not self._link_unchanged(os.path.join(data_path, *parts), dest, size, mtime_ns):
+                    shutil.copyfile(self._blob_path(file_hash), dest)
+                    os.utime(dest, ns=(mtime_ns, mtime_ns))
+        except BaseException:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+
+        if os.path.exists(data_path):
+            os.rename(data_path, replaced_path)
+        try:
+            os.rename(staging_path, data_path)
+        except BaseException:
+            if os.path.exists(replaced_path):
+                os.rename(replaced_path, data_path)
+            raise
+        shutil.rmtree(replaced_path, ignore_errors=True)
+
+    @staticmethod
+    def _link_unchanged(current: str, dest: str, size: int, mtime_ns: int) -> bool:
+        """Hard-link ``current`` to ``dest`` if it still has the snapshot's size and mtime"""
+        try:
+            stat_info = os.stat(current)
+            if stat_info.st_size != size or stat_info.st_mtime_ns != mtime_ns:
+                return False
+            os.link(current, dest)
+            return True
+        except OSError:
+            # Gone, or no hard links on this file system
+            return False
+
+    def delete(self, snapshot_id: str):
+        """Remove a snapshot manifest, its blobs are freed by gc()"""
+        os.remove(self._manifest_path(snapshot_id))
+
+    def prune(self, name: str, policy: RetentionPolicy) -> List[str]:
+        """
+        Delete the snapshots of a data directory that the policy doesn't keep
+
+        Returns:
+            list: Deleted snapshot ids
+        """
+        snapshots = self.list_snapshots(name)
+        keep = policy.select(snapshots)
+        removed = []
+        for snapshot in snapshots:
+            if snapshot['id'] not in keep:
+                self.delete(snapshot['id'])
+                removed.append(snapshot['id'])
+        return removed
+
+    def gc(self, grace_period: float = GC_GRACE_PERIOD) -> Tuple[int, int]:
+        """
+        Remove blobs that no snapshot references
+
+        Args:
+            grace_period: Keep unreferenced blobs modified within this many seconds
+
+        Returns:
+            tuple: (removed blob count, freed bytes)
+        """
+        with self._lock:
+            referenced = set()
+            for snapshot in self.list_snapshots():
+                try:
+                    manifest = self.load_manifest(snapshot['id'])
+                except (OSError, ValueError):
+                    # An unreadable manifest might reference anything
+                    return 0, 0
+                referenced.update(row[3] for row in manifest['files'])
+
+            removed = freed = 0
+            cutoff = time.time() - grace_period
+            for root, _, files in os.walk(self.objects_dir):
+                for file_name in files:
+                    if file_name in referenced:
+                        continue
+                    path = os.path.join(root, file_name)
+                    try:
+                        stat_info = os.stat(path)
+                        if stat_info.st_mtime < cutoff:
+                            os.remove(path)
+                            removed += 1
+                            freed += stat_info.st_size
+                    except OSError:
+                        pass
+            return removed, freed
@@ -7,19 +7,47 @@ Python client for synchronizing SillyTavern user data from remote server
 
 import os
 import json
+import hashlib
 import requests
 import zipfile
 import io
 import shutil
 import time
-from datetime import datetime, timedelta
-from pathlib import Path
-import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import argparse
 
+from features.sync.backup import BackupStore, RetentionPolicy
+from features.sync.delta import apply_delta, block_size_for, file_signature
+from features.sync.diff import merge_entries, plan_sync
+from features.sync.framing import copy_body, read_header
+from features.sync.hashing import HASH_ALGORITHM, hash_file, new_hasher
+from features.sync.index import ManifestIndex, get_cache_dir
+from features.sync.merkle import MerkleTree
+from features.sync.tarstream import available_formats, open_tar_stream
+from features.sync.zipstream import iter_zip_stream, zip_entry_mtime
+
 
 class SyncClient:
-    def __init__(self, server_url, data_path=None, timeout=30):
+    # Files larger than this are always fetched with their own GET /file
+    BATCH_MAX_FILE_SIZE = 1024 * 1024
+    # Files at least this large are downloaded resumably via a partial file
+    RESUMABLE_MIN_SIZE = 8 * 1024 * 1024
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    # Append-mostly files (chats) that only fetch their new tail when the local copy is a prefix
+    APPEND_EXTENSIONS = {'.jsonl'}
+    # Below this the tail request costs more than a batched full download
+    APPEND_MIN_SIZE = 16 * 1024
+    # Concurrent downloads in incremental sync, enough to hide LAN round trips
+    DEFAULT_DOWNLOAD_WORKERS = 4
+    # /events sends a keepalive every 15 seconds, a silent connection is dead
+    EVENTS_READ_TIMEOUT = 45
+    # Full sync transports in order of preference, all extracted while downloading;
+    # a ZIP from a server without zip_streaming is downloaded first and only used last
+    ARCHIVE_FORMAT_PREFERENCE = ('tar.zst', 'zip', 'tar.gz')
+
+    def __init__(self, server_url, data_path=None, timeout=30, batch_size=100,
+                 delta_threshold=1024 * 1024, user=None, download_workers=None, backup_retention=None):
         """
         Initialize sync client
 
@@ -27,27 +55,58 @@ class SyncClient:
             server_url (str): Base URL of sync server (e.g., http://192.168.1.100:9999)
             data_path (str): Local SillyTavern data directory
             timeout (int): Request timeout in seconds
+            batch_size (int): Small files fetched per POST /files request (<= 1 disables batching)
+            delta_threshold (int): Changed files at least this large with a local copy are
+                fetched as a block delta via POST /delta (0 disables)
+            user (str): SillyTavern user handle to sync (default: the server's default user);
+                the default local path becomes data/<user>
+            download_workers (int): Concurrent downloads in incremental sync
+                (default: DEFAULT_DOWNLOAD_WORKERS, 1 downloads one file at a time)
+            backup_retention (RetentionPolicy): Snapshots kept after each backup (default: RetentionPolicy())
         """
         self.server_url = server_url.rstrip('/')
+        self.user = user
         self.data_path = data_path or self._find_data_path()
+        if user and not data_path:
+            self.data_path = os.path.join(os.path.dirname(self.data_path), user)
         self.timeout = timeout
+        self.batch_size = batch_size
+        self.delta_threshold = delta_threshold
+        self.download_workers = max(1, download_workers or self.DEFAULT_DOWNLOAD_WORKERS)
+        self.backup_retention = backup_retention or RetentionPolicy()
         self.session = requests.Session()
         self._is_closed = False
-
-        # 配置连接池
+        self._index = None
+        self._backup_store = None
+        self._manifest_cache = {}
+        self._tail_supported = True
+        self._delta_supported = True
+        self._tree_supported = True
+        self._remote_journal = None  # (journal_id, cursor) of the last remote manifest
+        self._server_archive_formats = None  # from /health, ['zip'] for older servers
+        self._server_zip_streaming = False  # from /health, whether every ZIP entry is self-delimiting
+        self._follow_stop = threading.Event()
+        self._follow_response = None
+
+        # 配置连接池，每个下载线程都能复用一个保持的连接
         adapter = requests.adapters.HTTPAdapter(
             pool_connections=10,
-            pool_maxsize=10,
+            pool_maxsize=max(10, self.download_workers + 2),
             max_retries=3
         )
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
+        if user:
+            # Merged into the query of every request
+            self.session.params = {'user': user}
 
         # Ensure data directory exists
         os.makedirs(self.data_path, exist_ok=True)
 
         print(f"数据同步客户端已初始化")
         print(f"服务器地址: {self.server_url}")
+        if user:
+            print(f"同步用户: {user}")
         print(f"本地数据路径: {self.data_path}")
 
     def _find_data_path(self):
@@ -73,8 +132,18 @@ class SyncClient:
         """关闭 session 并释放资源"""
         if not self._is_closed:
             self.session.close()
+            if self._index is not None:
+                self._index.close()
+                self._index = None
             self._is_closed = True
 
+    @property
+    def local_index(self):
+        """Persistent index of the local data directory (opened on first use)"""
+        if self._index is None:
+            self._index = ManifestIndex(self.data_path)
+        return self._index
+
     def __enter__(self):
         """支持上下文管理器协议"""
         return self
@@ -91,12 +160,12 @@ class SyncClient:
         except Exception:
             pass
 
-    def _request(self, endpoint, method='GET', params=None, stream=False):
+    def _request(self, endpoint, method='GET', params=None, stream=False, json_body=None, headers=None):
         """Make HTTP request to server"""
         url = f"{self.server_url}/{endpoint}"
         try:
             response = self.session.request(
-                method, url, params=params,
+                method, url, params=params, json=json_body, headers=headers,
                 timeout=(self.timeout, self.timeout * 2),  # (连接超时, 读取超时)
                 stream=stream
             )
@@ -112,6 +181,7 @@ class SyncClient:
         try:
             response = self._request('health')
             data = response.json()
+            self._remember_archive_support(data)
             print(f"服务器状态: 健康")
             print(f"服务器数据路径: {data.get('data_path', 'N/A')}")
             return True
@@ -119,6 +189,19 @@ class SyncClient:
             app_logger.error(f"服务器健康检查失败: {e}")
             return False
 
+    def get_remote_users(self):
+        """
+        List the users the server can sync
+
+        Returns:
+            list: User handles, ['default-user'] for servers without /users
+        """
+        try:
+            return self._request('users').json()['users']
+        except Exception as e:
+            app_logger.warning(f"获取用户列表失败，仅同步默认用户: {e}")
+            return ['default-user']
+
     def get_server_info(self):
         """Get server information"""
         try:
@@ -128,53 +211,266 @@ class SyncClient:
             app_logger.error(f"获取服务器信息失败: {e}")
             return None
 
-    def get_remote_manifest(self):
-        """Get file manifest from remote server"""
+    def get_remote_manifest(self, with_hash=True):
+        """
+        Get file manifest from remote server
+
+        The last manifest is cached with its ETag; an unchanged server answers
+        the conditional request with 304 and the cached copy is used.
+
+        Args:
+            with_hash (bool): Ask the server for content hashes
+
+        Returns:
+            list: Manifest entries, or None on failure
+        """
         try:
-            response = self._request('manifest')
+            params = {'hashes': '1'} if with_hash else None
+            cached = self._load_manifest_cache(with_hash)
+            headers = {'If-None-Match': cached['etag']} if cached else None
+
+            response = self._request('manifest', params=params, headers=headers)
+            if response.status_code == 304 and cached:
+                print("远程文件清单未变化，使用缓存")
+                return cached['manifest']
+
             data = response.json()
             if data.get('success'):
-                return data['manifest']
+                manifest = data['manifest']
+                if data.get('journal_id'):
+                    self._remote_journal = (data['journal_id'], data['cursor'])
+                if data.get('hash_algorithm') != HASH_ALGORITHM:
+                    # Hashes from a different algorithm can't be compared
+                    for item in manifest:
+                        item.pop('hash', None)
+                etag = response.headers.get('ETag')
+                if etag:
+                    self._save_manifest_cache(with_hash, etag, manifest)
+                return manifest
             else:
                 raise Exception(data.get('error', '未知错误'))
         except Exception as e:
             app_logger.error(f"获取远程文件清单失败: {e}")
             return None
 
-    def get_local_manifest(self):
-        """Generate local file manifest"""
-        manifest = []
+    def iter_remote_manifest(self, with_hash=True):
+        """
+        Stream the remote manifest in the compact NDJSON format
+
+        Entries are parsed one line at a time while the response arrives, so
+        the caller can diff them without holding the whole manifest. The body
+        is cached on disk with its ETag; an unchanged server answers the
+        conditional request with 304 and the cached copy is replayed. Servers
+        without NDJSON support fall back to get_remote_manifest().
+
+        Args:
+            with_hash (bool): Ask the server for content hashes
+
+        Returns:
+            iterator: Manifest entries (path, size, mtime, hash) in path order, or None on failure
+        """
+        params = {'format': 'ndjson', 'hashes': '1'} if with_hash else {'format': 'ndjson'}
+        cache_path = self._manifest_cache_path(with_hash, 'ndjson')
+        cached_etag = self._load_ndjson_cache_etag(cache_path)
+        headers = {'If-None-Match': cached_etag} if cached_etag else None
+
+        try:
+            response = self._request('manifest', params=params, stream=True, headers=headers)
+        except Exception as e:
+            app_logger.error(f"获取远程文件清单失败: {e}")
+            return None
+
+        if response.status_code == 304 and cached_etag:
+            response.close()
+            print("远程文件清单未变化，使用缓存")
+            return self._iter_cached_ndjson(cache_path)
 
-        for root, dirs, files in os.walk(self.data_path):
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
+        if not response.headers.get('Content-Type', '').startswith('application/x-ndjson'):
+            # Older server, only the JSON document is available
+            response.close()
+            manifest = self.get_remote_manifest(with_hash)
+            return iter(sorted(manifest, key=lambda f: f['path'])) if manifest is not None else None
 
-            for file in files:
-                # Skip hidden files and temporary files
-                if file.startswith('.') or file.endswith('.tmp'):
-                    continue
+        return self._iter_ndjson_manifest(
+            response.iter_lines(chunk_size=64 * 1024), cache_path, response.headers.get('ETag')
+        )
+
+    def _iter_cached_ndjson(self, cache_path):
+        with open(cache_path, 'rb') as f:
+            f.readline()  # ETag line
+            yield from self._iter_ndjson_manifest(f)
 
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, self.data_path)
-
-                try:
-                    stat_info = os.stat(file_path)
-                    manifest.append({
-                        'path': relative_path.replace('\\', '/'),  # Normalize to forward slashes
-                        'size': stat_info.st_size,
-                        'mtime': stat_info.st_mtime,
-                        'modified': datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
-                        'is_dir': False
-                    })
-                except OSError:
-                    # Skip files that can't be accessed
+    def _iter_ndjson_manifest(self, lines, cache_path=None, etag=None):
+        """
+        Parse NDJSON manifest lines, optionally copying them to the disk cache
+
+        The cache file is only replaced once the trailer arrived, so a
+        truncated or abandoned stream never becomes the cached manifest.
+        """
+        cache = None
+        if cache_path and etag:
+            cache = open(cache_path + '.tmp', 'wb')
+            cache.write(json.dumps({'etag': etag}).encode('utf-8') + b'\n')
+
+        complete = False
+        try:
+            lines = iter(lines)
+            header_line = next(lines, None)
+            if not header_line:
+                raise IOError("文件清单为空")
+            if cache:
+                cache.write(header_line.rstrip(b'\n') + b'\n')
+            header = json.loads(header_line)
+            fields = header['fields']
+            if header.get('journal_id'):
+                self._remote_journal = (header['journal_id'], header['cursor'])
+            # Hashes from a different algorithm can't be compared
+            keep_hash = header.get('hash_algorithm') == HASH_ALGORITHM
+
+            previous = None
+            for line in lines:
+                if not line.strip():
                     continue
+                if cache:
+                    cache.write(line.rstrip(b'\n') + b'\n')
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    if item.get('done'):
+                        complete = True
+                        break
+                    continue
+
+                entry = dict(zip(fields, item))
+                if not keep_hash or not entry.get('hash'):
+                    entry.pop('hash', None)
+                # The caller merges by path, an unsorted stream would corrupt the diff
+                if previous is not None and entry['path'] <= previous:
+                    raise IOError(f"文件清单未按路径排序: {entry['path']}")
+                previous = entry['path']
+                yield entry
+
+            if not complete:
+                raise IOError("文件清单被截断")
+        finally:
+            if cache:
+                cache.close()
+                if complete:
+                    os.replace(cache_path + '.tmp', cache_path)
+                else:
+                    os.unlink(cache_path + '.tmp')
+
+    def get_remote_changes(self):
+        """
+        Ask the server which files changed since the last complete sync
+
+        Returns:
+            dict: /changes response with ``changes``, ``journal_id`` and
+            ``cursor``, or None when the full manifest has to be compared
+        """
+        saved = self._load_changes_cursor()
+        if not saved:
+            return None
 
-        return manifest
+        try:
+            response = self._request('changes', params={
+                'since': saved['cursor'], 'journal': saved['journal_id'], 'hashes': '1'
+            })
+            data = response.json()
+        except Exception as e:
+            print(f"无法获取变更记录，进行完整比对: {e}")
+            return None
+
+        if not data.get('success') or data.get('reset'):
+            print("变更记录已失效，进行完整比对")
+            return None
+
+        if data.get('hash_algorithm') != HASH_ALGORITHM:
+            for item in data['changes']:
+                item.pop('hash', None)
+        return data
+
+    def _changes_cursor_path(self):
+        key = hashlib.sha1(f"{self.server_url}|{os.path.realpath(self.data_path)}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(get_cache_dir(), f"changes_{key}.json")
+
+    def _load_changes_cursor(self):
+        """Journal position ({'journal_id', 'cursor'}) the local data is current with, or None"""
+        try:
+            with open(self._changes_cursor_path(), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            return saved if saved.get('journal_id') and isinstance(saved.get('cursor'), int) else None
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _save_changes_cursor(self, journal):
+        """Remember the journal position after a sync that fully succeeded
+
+        The local index version is stored too: another sync into the same
+        directory (a different user or server) changes it without the files
+        differing from what this index last saw.
+        """
+        if not journal:
+            return
+        try:
+            with open(self._changes_cursor_path(), 'w', encoding='utf-8') as f:
+                json.dump({'journal_id': journal[0], 'cursor': journal[1],
+                           'local_version': self.local_index.version}, f)
+        except OSError as e:
+            app_logger.warning(f"保存变更游标失败: {e}")
+
+    def _load_ndjson_cache_etag(self, cache_path):
+        """ETag of the cached NDJSON manifest, or None"""
+        try:
+            with open(cache_path, 'rb') as f:
+                return json.loads(f.readline())['etag']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _manifest_cache_path(self, with_hash, fmt='json'):
+        key = hashlib.sha1(f"{self.server_url}|{self.user or ''}|{int(with_hash)}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(get_cache_dir(), f"remote_manifest_{key}.{fmt}")
+
+    def _load_manifest_cache(self, with_hash):
+        """Get the cached remote manifest ({'etag', 'manifest'}) or None"""
+        cached = self._manifest_cache.get(with_hash)
+        if cached is None:
+            try:
+                with open(self._manifest_cache_path(with_hash), 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                self._manifest_cache[with_hash] = cached
+            except (OSError, ValueError):
+                return None
+        return cached
+
+    def _save_manifest_cache(self, with_hash, etag, manifest):
+        cached = {'etag': etag, 'manifest': manifest}
+        self._manifest_cache[with_hash] = cached
+        try:
+            with open(self._manifest_cache_path(with_hash), 'w', encoding='utf-8') as f:
+                json.dump(cached, f, ensure_ascii=False)
+        except OSError as e:
+            app_logger.warning(f"保存文件清单缓存失败: {e}")
+
+    def get_local_manifest(self, with_hash=False):
+        """
+        Generate local file manifest
+
+        Args:
+            with_hash (bool): Include content hashes (cached in the local index)
+        """
+        return self.local_index.manifest(with_hash=with_hash, full=True)
 
     def sync_full_zip(self, backup=True):
         """
-        Synchronize using full ZIP download
+        Synchronize using full archive download
+
+        If both sides support a tar transport or the server's ZIP can be read
+        front to back (see ARCHIVE_FORMAT_PREFERENCE), the archive is first
+        extracted into a staging directory while it downloads and moved into
+        the data directory once complete. If that fails, or a ZIP download was
+        interrupted before, a ZIP is downloaded first: an interrupted download
+        is kept together with a checkpoint, the next call continues it with a
+        Range request and reuses the backup that was made for it.
 
         Args:
             backup (bool): Whether to backup existing data
@@ -182,29 +478,49 @@ class SyncClient:
         Returns:
             bool: Success status
         """
-        print("开始 ZIP 全量同步...")
+        zip_path = self._zip_download_path()
+        checkpoint = self._load_checkpoint(zip_path)
 
         if backup:
-            if not self._backup_existing_data():
+            backup_id = checkpoint.get('backup_id')
+            if backup_id and self.backup_store.exists(backup_id):
+                print(f"继续上次中断的同步，沿用已有备份: {backup_id}")
+                self._last_backup_id = backup_id
+            elif self._backup_existing_data():
+                checkpoint['backup_id'] = getattr(self, '_last_backup_id', None)
+                self._save_checkpoint(zip_path, checkpoint)
+            else:
                 app_logger.error("备份失败，取消同步")
                 return False
 
-        temp_zip_path = None
+        # A partial ZIP download is continued rather than started over as a stream,
+        # and after a failed stream every retry uses the resumable download
+        streaming = not checkpoint.get('etag') and not checkpoint.get('stream_failed')
+        fmt = self._choose_archive_format() if streaming else 'zip'
+        if streaming and (fmt != 'zip' or self._server_zip_streaming):
+            if self._sync_full_streaming(fmt):
+                self._discard_download(zip_path)
+                return True
+            print("边下载边解压失败，改为可续传的 ZIP 下载...")
+            checkpoint['stream_failed'] = True
+            self._save_checkpoint(zip_path, checkpoint)
+
+        print("开始 ZIP 全量同步...")
+
         try:
-            # Download ZIP file
+            # Download ZIP file, local data is untouched until it is complete
             print("正在下载 ZIP 文件...")
-            response = self._request('zip', stream=True)
-
-            # Create temporary zip file
-            with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as temp_file:
-                temp_zip_path = temp_file.name
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        temp_file.write(chunk)
+            self._download_resumable('zip', zip_path)
+            if not zipfile.is_zipfile(zip_path):
+                raise IOError("ZIP 文件不完整")
+        except Exception as e:
+            app_logger.error(f"ZIP 下载中断，已保留下载进度，重试时将继续: {e}")
+            return False
 
+        try:
             # Extract ZIP file
             print("正在解压 ZIP 文件...")
-            self._extract_zip_with_progress(temp_zip_path, self.data_path)
+            self._extract_zip_with_progress(zip_path, self.data_path)
 
             print("ZIP 全量同步完成")
             return True
@@ -216,12 +532,70 @@ class SyncClient:
                 self._restore_backup()
             return False
         finally:
-            # 确保临时文件被删除
-            if temp_zip_path and os.path.exists(temp_zip_path):
-                try:
-                    os.unlink(temp_zip_path)
-                except Exception as cleanup_error:
-                    app_logger.error(f"清理临时文件失败: {cleanup_error}")
+            self._discard_download(zip_path)
+
+    def _remember_archive_support(self, health):
+        """Store the archive capabilities a /health response announces"""
+        self._server_archive_formats = health.get('archive_formats', ['zip'])
+        self._server_zip_streaming = bool(health.get('zip_streaming'))
+
+    def _choose_archive_format(self):
+        """Preferred full sync transport supported by both the server and this client"""
+        if self._server_archive_formats is None:
+            try:
+                self._remember_archive_support(self._request('health').json())
+            except Exception:
+                return 'zip'
+
+        supported = set(available_formats()) | {'zip'}
+        for fmt in self.ARCHIVE_FORMAT_PREFERENCE:
+            if fmt == 'zip' and not self._server_zip_streaming:
+                continue
+            if fmt in supported and fmt in self._server_archive_formats:
+                return fmt
+        return 'zip'
+
+    def _sync_full_streaming(self, fmt):
+        """
+        Synchronize by extracting an archive while it downloads
+
+        Files are extracted into a staging directory next to the data
+        directory and only moved into it once the whole archive arrived, so an
+        interrupted transfer leaves the local data untouched.
+
+        Args:
+            fmt (str): 'zip' (from a server with zip_streaming), 'tar', 'tar.gz' or 'tar.zst'
+
+        Returns:
+            bool: Success status
+        """
+        print(f"开始 {fmt} 全量同步，边下载边解压...")
+        staging_path = self.data_path.rstrip('/\\') + '.incoming'
+
+        try:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            os.makedirs(staging_path)
+            with self._request('zip', params={'format': fmt}, stream=True) as response:
+                self._extract_stream(response, fmt, staging_path)
+
+            self._install_staged(staging_path, self.data_path)
+            print(f"{fmt} 全量同步完成")
+            return True
+
+        except Exception as e:
+            app_logger.error(f"{fmt} 同步失败: {e}")
+            return False
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    def _install_staged(self, staging_path, target_path):
+        """Move every file of a completely extracted staging directory into target_path"""
+        for root, _dirs, files in os.walk(staging_path):
+            rel_root = os.path.relpath(root, staging_path)
+            dest_root = os.path.normpath(os.path.join(target_path, rel_root))
+            os.makedirs(dest_root, exist_ok=True)
+            for name in files:
+                os.replace(os.path.join(root, name), os.path.join(dest_root, name))
 
     def sync_incremental(self):
         """
@@ -233,76 +607,278 @@ class SyncClient:
         print("开始增量同步...")
 
         try:
-            # Get remote and local manifests
-            print("获取文件清单...")
-            remote_manifest = self.get_remote_manifest()
-            local_manifest = self.get_local_manifest()
+            # Only the changes since the last sync are needed if the local copy is untouched;
+            # checking that is a local re-stat, no remote listing
+            self._remote_journal = None
+            changes = None
+            saved = self._load_changes_cursor()
+            if saved:
+                if (self.local_index.refresh(full=True) == 0
+                        and saved.get('local_version') == self.local_index.version):
+                    changes = self.get_remote_changes()
+                else:
+                    print("本地数据有改动，进行完整比对")
 
-            if not remote_manifest:
-                print("无法获取远程文件清单")
-                return False
+            if changes is not None:
+                print(f"按变更记录同步，共 {len(changes['changes'])} 项变更")
+                self._remote_journal = (changes['journal_id'], changes['cursor'])
+                pairs = self._pair_changes(changes['changes'])
+            else:
+                self.local_index.refresh(full=True)
+                # A populated local copy descends the Merkle tree, only differing directories are listed
+                pairs = self._diff_tree() if len(self.local_index) else None
 
-            # Create local manifest lookup
-            local_files = {item['path']: item for item in local_manifest}
-
-            # Analyze differences
-            files_to_download = []
-            files_to_delete = []
-            total_size = 0
-
-            for remote_file in remote_manifest:
-                path = remote_file['path']
-                local_file = local_files.get(path)
-
-                if not local_file:
-                    # File exists remotely but not locally - download
-                    files_to_download.append(remote_file)
-                    total_size += remote_file['size']
-                elif remote_file['mtime'] > local_file['mtime']:
-                    # Remote file is newer - download
-                    files_to_download.append(remote_file)
-                    total_size += remote_file['size']
-
-            # Check for local files that don't exist remotely
-            for local_path in local_files:
-                if local_path not in [f['path'] for f in remote_manifest]:
-                    files_to_delete.append(local_path)
-
-            if not files_to_download and not files_to_delete:
-                print("数据已是最新，无需同步")
-                return True
+            if pairs is None:
+                # Get remote and local manifests
+                print("获取文件清单...")
+                remote_manifest = self.iter_remote_manifest()
+                if remote_manifest is None:
+                    print("无法获取远程文件清单")
+                    return False
 
-            print(f"需要下载 {len(files_to_download)} 个文件 ({self._format_size(total_size)})")
-            print(f"需要删除 {len(files_to_delete)} 个文件")
-
-            # Delete obsolete files
-            for file_path in files_to_delete:
-                full_path = os.path.join(self.data_path, file_path)
-                try:
-                    os.remove(full_path)
-                    print(f"已删除: {file_path}")
-                except Exception as e:
-                    print(f"删除文件失败 {file_path}: {e}")
-
-            # Download new/updated files
-            downloaded_size = 0
-            for i, file_info in enumerate(files_to_download, 1):
-                success = self._download_file(file_info)
-                if success:
-                    downloaded_size += file_info['size']
-                    progress = (i / len(files_to_download)) * 100
-                    print(f"进度: {i}/{len(files_to_download)} ({progress:.1f}%) - "
-                          f"{self._format_size(downloaded_size)}/{self._format_size(total_size)}")
-                else:
-                    print(f"下载失败: {file_info['path']}")
+                # Sorted merge while the manifest streams in
+                pairs = merge_entries(remote_manifest, self.local_index.entries())
 
-            print("增量同步完成")
-            return True
+            return self._sync_pairs(pairs)
 
         except Exception as e:
             print(f"增量同步失败: {e}")
             return False
 
+    def apply_changes(self, payload):
+        """
+        Apply a /changes payload (also the data of an /events ``changes`` event)
+
+        Args:
+            payload (dict): Response with ``changes``, ``journal_id`` and ``cursor``
+
+        Returns:
+            bool: Success status
+        """
+        if payload.get('hash_algorithm') != HASH_ALGORITHM:
+            for item in payload['changes']:
+                item.pop('hash', None)
+
+        print(f"收到 {len(payload['changes'])} 项变更")
+        self._remote_journal = (payload['journal_id'], payload['cursor'])
+        try:
+            return self._sync_pairs(self._pair_changes(payload['changes']))
+        except Exception as e:
+            print(f"应用变更失败: {e}")
+            return False
+
+    def follow(self, on_change=None, reconnect_delay=3.0):
+        """
+        Keep the local copy in step with the server until stop_follow() is called
+
+        After an incremental sync the client listens on /events and applies
+        each pushed change batch. A reset event or a failed batch triggers a
+        full incremental sync, a dropped connection is re-established with the
+        saved cursor. Servers without /events are polled every reconnect_delay
+        seconds instead.
+
+        Args:
+            on_change (callable): Called with the success flag after every applied batch
+            reconnect_delay (float): Seconds to wait before reconnecting
+        """
+        self._follow_stop.clear()
+        print("进入跟随模式，实时同步服务器变更")
+        need_sync = True
+        events_supported = True
+
+        while not self._follow_stop.is_set():
+            if need_sync or not events_supported:
+                success = self.sync_incremental()
+                if on_change:
+                    on_change(success)
+                need_sync = not success
+                if need_sync or not events_supported:
+                    self._follow_stop.wait(reconnect_delay)
+                    continue
+
+            saved = self._load_changes_cursor()
+            if not saved:
+                need_sync = True
+                continue
+
+            try:
+                response = self.session.get(
+                    f"{self.server_url}/events",
+                    params={'since': saved['cursor'], 'journal': saved['journal_id']},
+                    stream=True,
+                    timeout=(self.timeout, self.EVENTS_READ_TIMEOUT)
+                )
+                if response.status_code == 404 and \
+                        not response.headers.get('Content-Type', '').startswith('application/json'):
+                    print("服务器不支持变更推送，改为定时轮询")
+                    response.close()
+                    events_supported = False
+                    continue
+                response.raise_for_status()
+                self._follow_response = response
+
+                for event, data in self._iter_sse(response):
+                    if self._follow_stop.is_set():
+                        break
+                    if event == 'reset':
+                        print("变更记录已失效，重新同步")
+                        need_sync = True
+                        break
+                    if event == 'changes':
+                        success = self.apply_changes(json.loads(data))
+                        if on_change:
+                            on_change(success)
+                        if not success:
+                            need_sync = True
+                            break
+            except Exception as e:
+                if not self._follow_stop.is_set():
+                    print(f"变更推送连接中断，{reconnect_delay:.0f} 秒后重连: {e}")
+                    self._follow_stop.wait(reconnect_delay)
+            finally:
+                self._follow_response = None
+
+        print("已退出跟随模式")
+
+    def stop_follow(self):
+        """Stop follow(), callable from another thread"""
+        self._follow_stop.set()
+        response = self._follow_response
+        if response is not None:
+            # Unblocks the pending read of the event stream
+            response.close()
+
+    def _iter_stream_lines(self, response):
+        """Lines of a streaming response, each yielded as soon as it has arrived"""
+        read1 = getattr(response.raw, 'read1', None)
+        if read1 is None:
+            # urllib3 1.x only returns partial data when reading byte by byte
+            yield from response.iter_lines(chunk_size=1)
+            return
+
+        pending = b''
+        while True:
+            chunk = read1(64 * 1024)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip(b'\r')
+        if pending:
+            yield pending
+
+    def _iter_sse(self, response):
+        """
+        Parse a Server-Sent Events stream
+
+        Yields:
+            tuple: (event, data) per dispatched event, comments are skipped
+        """
+        event, data = 'message', []
+        for line in self._iter_stream_lines(response):
+            line = line.decode('utf-8')
+            if not line:
+                if data:
+                    yield event, '\n'.join(data)
+                event, data = 'message', []
+            elif line.startswith(':'):
+                continue
+            else:
+                field, _, value = line.partition(':')
+                value = value[1:] if value.startswith(' ') else value
+                if field == 'event':
+                    event = value
+                elif field == 'data':
+                    data.append(value)
+
+    def _sync_pairs(self, pairs):
+        """
+        Bring local files in line with paired remote/local entries
+
+        Args:
+            pairs: (remote_entry, local_entry) tuples, None for a missing side
+
+        Returns:
+            bool: True if every operation succeeded, only then the journal cursor is saved
+        """
+        plan = plan_sync(pairs, self.local_index)
+        files_to_download = plan.downloads
+        files_to_delete = plan.deletes
+        local_sizes = plan.local_sizes
+
+        # Grown append-only files try fetching just the new bytes
+        files_to_append = [
+            f for f in files_to_download
+            if self._is_append_candidate(f, local_sizes.get(f['path']))
+        ]
+        if files_to_append:
+            appended = {f['path'] for f in files_to_append}
+            files_to_download = [f for f in files_to_download if f['path'] not in appended]
+        total_size = sum(f['size'] for f in files_to_download)
+
+        plan.downloads = files_to_download
+        if not plan and not files_to_append:
+            print("数据已是最新，无需同步")
+            self._save_changes_cursor(self._remote_journal)
+            return True
+
+        if plan.moves or plan.copies:
+            print(f"本地重命名 {len(plan.moves)} 个文件，本地复制 {len(plan.copies)} 个文件")
+        if files_to_append:
+            print(f"需要追加 {len(files_to_append)} 个文件")
+        print(f"需要下载 {len(files_to_download)} 个文件 ({self._format_size(total_size)})")
+        print(f"需要删除 {len(files_to_delete)} 个文件")
+
+        failed_count = 0
+
+        # Rebuild files from local ones with the same content; copies first, their source may be moved
+        for move, operations in ((False, plan.copies), (True, plan.moves)):
+            for source, file_info in operations:
+                if not self._copy_local_file(source, file_info, move=move):
+                    files_to_download.append(file_info)
+                    total_size += file_info['size']
+
+        # Delete obsolete files
+        for file_path in files_to_delete:
+            full_path = os.path.join(self.data_path, file_path)
+            try:
+                os.remove(full_path)
+                print(f"已删除: {file_path}")
+            except Exception as e:
+                print(f"删除文件失败 {file_path}: {e}")
+                failed_count += 1
+        if files_to_delete or plan.moves:
+            # Record the deletions so the next sync doesn't see local changes
+            self.local_index.refresh()
+
+        # Append new tails, files whose prefix changed are downloaded whole
+        appended_size = 0
+        for file_info in files_to_append:
+            local_size = local_sizes[file_info['path']]
+            if self._download_tail(file_info, local_size):
+                appended_size += file_info['size'] - local_size
+            else:
+                files_to_download.append(file_info)
+                total_size += file_info['size']
+        if files_to_append:
+            print(f"追加完成，传输 {self._format_size(appended_size)}")
+
+        # Download new/updated files, small ones in batches via POST /files
+        failed_count += self._download_files(files_to_download, total_size)
+
+        # A pending ZIP download is obsolete once the data is current
+        self._discard_download(self._zip_download_path())
+
+        # Failed files must show up again next time, so the cursor only advances on full success
+        if failed_count:
+            print(f"增量同步未完成，{failed_count} 个文件失败")
+            return False
+
+        self._save_changes_cursor(self._remote_journal)
+        print("增量同步完成")
+        return True
+
     def sync(self, prefer_zip=True, backup=True):
         """
         Synchronize data with automatic fallback
@@ -344,77 +920,607 @@ class SyncClient:
                 print("增量同步失败，尝试 ZIP 同步...")
                 return self.sync_full_zip(backup=backup)
 
+    def _download_files(self, files_to_download, total_size):
+        """
+        Download files on ``download_workers`` threads sharing the session's connection pool
+
+        Small files are grouped into POST /files batches, the rest are fetched
+        one by one. Jobs start largest first so a big file doesn't end up
+        running alone at the end; files missing from a failed batch are
+        queued again as single downloads.
+
+        Args:
+            files_to_download (list): Remote manifest entries
+            total_size (int): Bytes to download, for progress output
+
+        Returns:
+            int: Number of files that could not be downloaded
+        """
+        jobs = []
+        single_files = files_to_download
+        if self.batch_size > 1:
+            # Delta candidates go through _download_file()
+            small_files, single_files = [], []
+            for f in files_to_download:
+                if f['size'] <= self.BATCH_MAX_FILE_SIZE and not self._is_delta_candidate(f):
+                    small_files.append(f)
+                else:
+                    single_files.append(f)
+            small_files.sort(key=lambda f: f['size'], reverse=True)
+            for start in range(0, len(small_files), self.batch_size):
+                jobs.append(('batch', small_files[start:start + self.batch_size]))
+        jobs.extend(('file', [f]) for f in single_files)
+        jobs.sort(key=lambda job: sum(f['size'] for f in job[1]), reverse=True)
+
+        progress_lock = threading.Lock()
+        progress = {'count': 0, 'size': 0, 'failed': 0}
+
+        def run(kind, file_infos):
+            if kind == 'batch':
+                done = self._download_batch(file_infos)
+                retry = [f for f in file_infos if f['path'] not in done]
+                finished = [f for f in file_infos if f['path'] in done]
+            else:
+                retry = []
+                finished = file_infos if self._download_file(file_infos[0]) else []
+                if not finished:
+                    print(f"下载失败: {file_infos[0]['path']}")
+
+            with progress_lock:
+                progress['count'] += len(finished)
+                progress['size'] += sum(f['size'] for f in finished)
+                if kind == 'file' and not finished:
+                    progress['failed'] += 1
+                if finished:
+                    percent = (progress['count'] / len(files_to_download)) * 100
+                    print(f"进度: {progress['count']}/{len(files_to_download)} ({percent:.1f}%) - "
+                          f"{self._format_size(progress['size'])}/{self._format_size(total_size)}")
+            return retry
+
+        with ThreadPoolExecutor(max_workers=self.download_workers) as pool:
+            pending = {pool.submit(run, kind, file_infos) for kind, file_infos in jobs}
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    # Retry with a single request
+                    for file_info in future.result():
+                        pending.add(pool.submit(run, 'file', [file_info]))
+
+        return progress['failed']
+
     def _download_file(self, file_info):
         """Download single file from server"""
         try:
-            response = self._request('file', params={'path': file_info['path']}, stream=True)
-
             # Ensure directory exists
-            file_path = os.path.join(self.data_path, file_info['path'])
+            file_path = self._local_file_path(file_info['path'])
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-            # Save file
+            if self._is_delta_candidate(file_info) and self._download_delta(file_info):
+                return True
+
+            if file_info['size'] >= self.RESUMABLE_MIN_SIZE:
+                # Large file - keep a partial file so a retry can continue
+                partial_path = file_path + '.part.tmp'
+                self._download_resumable('file', partial_path, params={'path': file_info['path']})
+                os.replace(partial_path, file_path)
+                self._discard_download(partial_path)
+
+                os.utime(file_path, (file_info['mtime'], file_info['mtime']))
+                self.local_index.update_file(file_info['path'])
+                return True
+
+            response = self._request('file', params={'path': file_info['path']}, stream=True)
+
+            # Save file, hashing it on the way so the local index needn't reread it
+            hasher = new_hasher()
             with open(file_path, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
                     if chunk:
                         f.write(chunk)
+                        hasher.update(chunk)
 
             # Set modification time to match remote
             os.utime(file_path, (file_info['mtime'], file_info['mtime']))
+            self.local_index.update_file(file_info['path'], hasher.hexdigest())
             return True
 
         except Exception as e:
             print(f"下载文件失败 {file_info['path']}: {e}")
             return False
 
-    def _backup_existing_data(self):
-        """Backup existing data directory"""
-        if not os.path.exists(self.data_path) or not os.listdir(self.data_path):
-            print("本地数据目录为空，无需备份")
-            return True
+    def _diff_tree(self):
+        """
+        Compare the local Merkle tree with the server's
 
-        # 创建备份目录在启动器运行路径下
-        launcher_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        backup_dir = os.path.join(launcher_dir, "backup")
-        os.makedirs(backup_dir, exist_ok=True)
+        Starting at the root, only directories whose hashes differ are
+        fetched with /tree, so unchanged folders cost nothing beyond their
+        parent's listing and an up-to-date copy costs a single request.
 
-        # 使用数据目录的相对路径作为备份文件夹名
-        data_dir_name = os.path.basename(self.data_path.rstrip('/\\'))
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_path = os.path.join(backup_dir, f"{data_dir_name}_{timestamp}")
+        Returns:
+            list: (remote_entry, local_entry) pairs for the files of differing
+            directories like merge_entries(), or None if the server has no /tree
+        """
+        if not self._tree_supported:
+            return None
 
+        self.local_index.ensure_hashes()
+        local_tree = MerkleTree(self.local_index.entries())
+
+        def local_files_under(rel_dir):
+            stack = [rel_dir]
+            while stack:
+                current = stack.pop()
+                yield from local_tree.files.get(current, {}).values()
+                stack.extend(local_tree.subdirs.get(current, ()))
+
+        pairs = []
+        request_count = 0
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                response = self.session.get(
+                    f"{self.server_url}/tree", params={'path': rel_dir},
+                    timeout=(self.timeout, self.timeout * 2)
+                )
+                if response.status_code == 404 and \
+                        not response.headers.get('Content-Type', '').startswith('application/json'):
+                    # Server without /tree support
+                    self._tree_supported = False
+                    return None
+                response.raise_for_status()
+                node = response.json()
+            except Exception as e:
+                print(f"目录树比对失败，改用完整文件清单: {e}")
+                return None
+
+            if node.get('hash_algorithm') != HASH_ALGORITHM:
+                return None
+            request_count += 1
+            if not rel_dir and node.get('journal_id'):
+                self._remote_journal = (node['journal_id'], node['cursor'])
+            if node['hash'] and node['hash'] == local_tree.hashes.get(rel_dir):
+                continue
+
+            local_files = sorted(local_tree.files.get(rel_dir, {}).values(), key=lambda e: e.path)
+            pairs.extend(merge_entries(node['files'], local_files))
+
+            remote_dirs = {item['name']: item['hash'] for item in node['dirs']}
+            for name, dir_hash in remote_dirs.items():
+                child = f"{rel_dir}/{name}" if rel_dir else name
+                # A directory with unhashed files on either side is always listed
+                if not dir_hash or local_tree.hashes.get(child) != dir_hash:
+                    stack.append(child)
+            for child in local_tree.subdirs.get(rel_dir, ()):
+                if child.rpartition('/')[2] not in remote_dirs:
+                    pairs.extend((None, entry) for entry in local_files_under(child))
+
+        print(f"目录树比对完成，共请求 {request_count} 个目录")
+        return pairs
+
+    def _pair_changes(self, changes):
+        """
+        Pair /changes entries with local entries
+
+        Yields:
+            tuple: (remote_entry, local_entry) like merge_entries(); tombstones
+            of files the client has become (None, local_entry)
+        """
+        for item in changes:
+            local_entry = self.local_index.get(item['path'])
+            if item['op'] != 'delete':
+                yield item, local_entry
+            elif local_entry is not None:
+                yield None, local_entry
+
+    def _copy_local_file(self, source, file_info, move=False):
+        """
+        Rebuild a remote file from a local file with the same content
+
+        Args:
+            source (str): Local path (relative) holding the content
+            file_info (dict): Remote manifest entry, with hash
+            move (bool): Rename the source instead of copying it
+
+        Returns:
+            bool: True on success, False to download the file
+        """
+        path = file_info['path']
         try:
-            print(f"备份现有数据到: {backup_path}")
-            shutil.copytree(self.data_path, backup_path)
+            source_path = self._local_file_path(source)
+            file_path = self._local_file_path(path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-            # Store backup path for potential restore
-            self._last_backup_path = backup_path
-            return True
+            if move:
+                os.replace(source_path, file_path)
+                file_hash = hash_file(file_path)
+            else:
+                temp_path = file_path + '.copy.tmp'
+                hasher = new_hasher()
+                with open(source_path, 'rb') as src, open(temp_path, 'wb') as dest:
+                    for chunk in iter(lambda: src.read(self.DOWNLOAD_CHUNK_SIZE), b''):
+                        dest.write(chunk)
+                        hasher.update(chunk)
+                os.replace(temp_path, file_path)
+                file_hash = hasher.hexdigest()
+
+            if file_hash != file_info['hash']:
+                raise IOError("本地文件内容已变化")
+        except Exception as e:
+            print(f"本地复制失败 {path}，改为下载: {e}")
+            return False
+
+        os.utime(file_path, (file_info['mtime'], file_info['mtime']))
+        self.local_index.update_file(path, file_hash)
+        return True
+
+    def _is_append_candidate(self, file_info, local_size):
+        """Whether a changed file may have been appended to since the local copy"""
+        if not self._tail_supported or local_size is None:
+            return False
+        if os.path.splitext(file_info['path'])[1].lower() not in self.APPEND_EXTENSIONS:
+            return False
+        return self.APPEND_MIN_SIZE <= local_size < file_info['size']
+
+    def _download_tail(self, file_info, local_size):
+        """
+        Append the bytes a remote file gained since the local copy
+
+        The server only answers if its first ``local_size`` bytes hash to the
+        local file's hash. The result is checked against the remote hash and
+        rolled back to the original length on any failure.
+
+        Args:
+            file_info (dict): Remote manifest entry
+            local_size (int): Current size of the local file
+
+        Returns:
+            bool: True if the file is now complete, False to download it whole
+        """
+        path = file_info['path']
+        try:
+            file_path = self._local_file_path(path)
+            self.local_index.ensure_hashes([path])
+            entry = self.local_index.get(path)
+            if entry is None or entry.hash is None or entry.size != local_size:
+                return False
 
+            response = self.session.get(
+                f"{self.server_url}/tail",
+                params={'path': path, 'offset': local_size, 'prefix_hash': entry.hash},
+                stream=True,
+                timeout=(self.timeout, self.timeout * 2)
+            )
+            if response.status_code == 412:
+                response.close()
+                return False
+            if response.status_code == 404 and \
+                    not response.headers.get('Content-Type', '').startswith('application/json'):
+                # Server without /tail support
+                response.close()
+                self._tail_supported = False
+                return False
+            response.raise_for_status()
         except Exception as e:
-            print(f"备份失败: {e}")
+            print(f"追加下载失败 {path}: {e}")
             return False
 
-    def _restore_backup(self):
-        """Restore data from last backup"""
-        if not hasattr(self, '_last_backup_path'):
-            print("没有找到备份文件")
+        try:
+            with open(file_path, 'r+b') as f:
+                f.seek(local_size)
+                for chunk in response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+
+            file_hash = hash_file(file_path)
+            if os.path.getsize(file_path) != file_info['size'] or \
+                    (file_info.get('hash') and file_hash != file_info['hash']):
+                raise IOError("追加后的文件与服务器不一致")
+        except Exception as e:
+            print(f"追加下载失败 {path}: {e}")
+            try:
+                with open(file_path, 'r+b') as f:
+                    f.truncate(local_size)
+            except OSError:
+                pass
             return False
 
-        backup_path = self._last_backup_path
-        if not os.path.exists(backup_path):
-            print("备份文件不存在")
+        os.utime(file_path, (file_info['mtime'], file_info['mtime']))
+        self.local_index.update_file(path, file_hash)
+        return True
+
+    def _is_delta_candidate(self, file_info):
+        """Whether a changed file is large enough, and present locally, to fetch as a delta"""
+        if not self._delta_supported or self.delta_threshold <= 0 or file_info['size'] < self.delta_threshold:
+            return False
+        local_entry = self.local_index.get(file_info['path'])
+        return local_entry is not None and local_entry.size >= self.delta_threshold
+
+    def _download_delta(self, file_info):
+        """
+        Rebuild a changed file from the local copy and a block delta
+
+        The signature of the local copy is uploaded, the new version is
+        assembled next to it from copied blocks and literal data and only
+        replaces it after its hash matched the server's.
+
+        Args:
+            file_info (dict): Remote manifest entry
+
+        Returns:
+            bool: True on success, False to download the file whole
+        """
+        path = file_info['path']
+        file_path = self._local_file_path(path)
+        temp_path = file_path + '.delta.tmp'
+
+        try:
+            basis_size = os.path.getsize(file_path)
+            block_size = block_size_for(basis_size)
+            signature = file_signature(file_path, block_size)
+
+            response = self.session.post(
+                f"{self.server_url}/delta",
+                json={'path': path, 'size': basis_size, 'block_size': block_size, 'blocks': signature},
+                stream=True,
+                timeout=(self.timeout, self.timeout * 2)
+            )
+            if response.status_code == 404 and \
+                    not response.headers.get('Content-Type', '').startswith('application/json'):
+                # Server without /delta support
+                response.close()
+                self._delta_supported = False
+                return False
+            response.raise_for_status()
+            response.raw.decode_content = True
+            stream = io.BufferedReader(response.raw, buffer_size=64 * 1024)
+
+            with open(file_path, 'rb') as basis, open(temp_path, 'wb') as out:
+                header = apply_delta(stream, basis, out, block_size)
+
+            if header['written_hash'] != header['hash'] or \
+                    (file_info.get('hash') and header['hash'] != file_info['hash']):
+                raise IOError("重建后的文件与服务器不一致")
+
+            os.replace(temp_path, file_path)
+            os.utime(file_path, (file_info['mtime'], file_info['mtime']))
+            self.local_index.update_file(path, header['hash'])
+
+            transferred = response.raw.tell() if hasattr(response.raw, 'tell') else 0
+            print(f"增量传输 {path}: {self._format_size(transferred)} / {self._format_size(header['size'])}")
+            return True
+
+        except Exception as e:
+            print(f"增量传输失败 {path}，改为完整下载: {e}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return False
+
+    def _download_batch(self, file_infos):
+        """
+        Download several files with one POST /files request
+
+        Args:
+            file_infos (list): Manifest entries to download
+
+        Returns:
+            set: Paths that were downloaded successfully
+        """
+        wanted = {f['path']: f for f in file_infos}
+        done = set()
+
+        try:
+            response = self._request('files', method='POST', json_body={'paths': list(wanted)}, stream=True)
+            response.raw.decode_content = True
+            stream = io.BufferedReader(response.raw, buffer_size=64 * 1024)
+
+            while True:
+                header = read_header(stream)
+                if header is None:
+                    raise IOError("响应在批次结束前被截断")
+                if header.get('done'):
+                    break
+
+                path = header.get('path')
+                file_info = wanted.get(path)
+                if file_info is None:
+                    raise IOError(f"服务器返回了未请求的文件: {path}")
+                if 'error' in header:
+                    print(f"下载文件失败 {path}: {header['error']}")
+                    continue
+
+                file_path = self._local_file_path(path)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+                hasher = new_hasher()
+                with open(file_path, 'wb') as f:
+                    for chunk in copy_body(stream, header['size'], f):
+                        hasher.update(chunk)
+
+                os.utime(file_path, (file_info['mtime'], file_info['mtime']))
+                self.local_index.update_file(path, hasher.hexdigest())
+                done.add(path)
+
+        except Exception as e:
+            print(f"批量下载失败，剩余文件将逐个下载: {e}")
+
+        return done
+
+    def _local_file_path(self, rel_path):
+        """Map a manifest path to a local path, refusing paths outside the data directory"""
+        base = os.path.realpath(self.data_path)
+        full_path = os.path.realpath(os.path.join(self.data_path, rel_path))
+        if not full_path.startswith(base + os.sep):
+            raise ValueError(f"不安全的文件路径: {rel_path}")
+        return full_path
+
+    def _download_resumable(self, endpoint, dest_path, params=None, max_attempts=3):
+        """
+        Download to ``dest_path``, continuing a previous partial download if possible
+
+        The ETag of the response is stored in a checkpoint next to the partial
+        file. A retry sends ``Range`` with ``If-Range`` so the server resumes
+        only if the resource is unchanged, otherwise it starts over.
+
+        Args:
+            endpoint (str): Server endpoint
+            dest_path (str): Partial/final file path
+            params (dict): Query parameters
+            max_attempts (int): Attempts before giving up (the partial file is kept)
+        """
+        source = endpoint + ('?' + '&'.join(f"{k}={v}" for k, v in sorted(params.items())) if params else '')
+        checkpoint = self._load_checkpoint(dest_path)
+        if checkpoint.get('source') != source:
+            checkpoint.pop('etag', None)
+            checkpoint['source'] = source
+
+        url = f"{self.server_url}/{endpoint}"
+        last_error = None
+
+        for attempt in range(1, max_attempts + 1):
+            offset = 0
+            headers = {}
+            if checkpoint.get('etag') and os.path.exists(dest_path):
+                offset = os.path.getsize(dest_path)
+                if offset:
+                    headers = {'Range': f'bytes={offset}-', 'If-Range': checkpoint['etag']}
+
+            try:
+                response = self.session.get(
+                    url, params=params, headers=headers, stream=True,
+                    timeout=(self.timeout, self.timeout * 2)
+                )
+                if response.status_code == 416:
+                    # Stale partial file - start over
+                    response.close()
+                    os.unlink(dest_path)
+                    checkpoint.pop('etag', None)
+                    continue
+                response.raise_for_status()
+
+                if response.status_code == 206:
+                    content_range = response.headers.get('Content-Range', '')
+                    start = int(content_range.split(' ', 1)[1].split('-', 1)[0])
+                    if start != offset:
+                        raise IOError(f"服务器返回了错误的续传位置: {content_range}")
+                    mode = 'ab'
+                    print(f"从 {self._format_size(offset)} 处继续下载")
+                else:
+                    mode = 'wb'
+
+                etag = response.headers.get('ETag')
+                if etag and not etag.startswith('W/'):
+                    checkpoint['etag'] = etag
+                else:
+                    # Weak or missing validator, can't resume safely
+                    checkpoint.pop('etag', None)
+                self._save_checkpoint(dest_path, checkpoint)
+
+                with open(dest_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                return
+
+            except Exception as e:
+                last_error = e
+                print(f"下载中断 ({attempt}/{max_attempts}): {e}")
+                if attempt < max_attempts:
+                    time.sleep(min(2 ** attempt, 10))
+
+        raise Exception(f"下载失败 {endpoint}: {last_error}")
+
+    def _zip_download_path(self):
+        """Stable partial download path for /zip of this server and data directory"""
+        key = hashlib.sha1(f"{self.server_url}|{os.path.realpath(self.data_path)}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(get_cache_dir(), f"download_{key}.zip")
+
+    def _checkpoint_path(self, dest_path):
+        return dest_path + '.ckpt.tmp'
+
+    def _load_checkpoint(self, dest_path):
+        """Load the checkpoint of a partial download (empty dict if none)"""
+        try:
+            with open(self._checkpoint_path(dest_path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self, dest_path, checkpoint):
+        with open(self._checkpoint_path(dest_path), 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+
+    def _discard_download(self, dest_path):
+        """Remove a partial download and its checkpoint"""
+        for path in (dest_path, self._checkpoint_path(dest_path)):
+            try:
+                if os.path.exists(path):
+                    os.unlink(path)
+            except Exception as cleanup_error:
+                app_logger.error(f"清理临时文件失败: {cleanup_error}")
+
+    @property
+    def backup_store(self):
+        """Deduplicated store of the snapshots taken before full syncs (opened on first use)"""
+        if self._backup_store is None:
+            # 备份目录在启动器运行路径下
+            launcher_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            self._backup_store = BackupStore(os.path.join(launcher_dir, "backup"))
+        return self._backup_store
+
+    def _backup_name(self):
+        # 使用数据目录的名称作为快照名
+        return os.path.basename(self.data_path.rstrip('/\\'))
+
+    def _backup_existing_data(self):
+        """Snapshot the data directory into the backup store, then apply the retention policy"""
+        if not os.path.exists(self.data_path) or not os.listdir(self.data_path):
+            print("本地数据目录为空，无需备份")
+            return True
+
+        try:
+            snapshot_id, added_files, added_bytes = self.backup_store.create(self.data_path, self._backup_name())
+            print(f"已备份现有数据: {snapshot_id} (新增 {added_files} 个文件，{self._format_size(added_bytes)})")
+
+            # Store snapshot id for potential restore
+            self._last_backup_id = snapshot_id
+        except Exception as e:
+            print(f"备份失败: {e}")
             return False
 
         try:
-            print(f"从备份恢复: {backup_path}")
+            removed = self.backup_store.prune(self._backup_name(), self.backup_retention)
+            if removed:
+                _, freed = self.backup_store.gc()
+                print(f"已清理 {len(removed)} 个旧备份，释放 {self._format_size(freed)}")
+        except Exception as e:
+            app_logger.warning(f"清理旧备份失败: {e}")
+        return True
+
+    def list_backups(self):
+        """
+        Snapshots of this data directory in the backup store
+
+        Returns:
+            list: Dicts with ``id``, ``name`` and ``created``, oldest first
+        """
+        return self.backup_store.list_snapshots(self._backup_name())
+
+    def restore_backup(self, snapshot_id):
+        """
+        Replace the local data with a snapshot from the backup store
 
-            # Remove current data
-            if os.path.exists(self.data_path):
-                shutil.rmtree(self.data_path)
+        Args:
+            snapshot_id (str): Id from list_backups()
 
-            # Restore backup
-            shutil.copytree(backup_path, self.data_path)
+        Returns:
+            bool: Success status
+        """
+        try:
+            print(f"从备份恢复: {snapshot_id}")
+            self.backup_store.restore(snapshot_id, self.data_path)
             print("数据恢复完成")
             return True
 
@@ -422,6 +1528,19 @@ class SyncClient:
             print(f"恢复备份失败: {e}")
             return False
 
+    def _restore_backup(self):
+        """Restore data from the snapshot taken before this sync"""
+        snapshot_id = getattr(self, '_last_backup_id', None)
+        if not snapshot_id:
+            print("没有找到备份文件")
+            return False
+
+        if not self.backup_store.exists(snapshot_id):
+            print("备份文件不存在")
+            return False
+
+        return self.restore_backup(snapshot_id)
+
     def _extract_zip_with_progress(self, zip_path, extract_path):
         """Extract ZIP file with progress reporting"""
         with zipfile.ZipFile(zip_path, 'r') as zip_file:
@@ -448,6 +1567,55 @@ class SyncClient:
                     progress = (i / total_files) * 100
                     print(f"解压进度: {i}/{total_files} ({progress:.1f}%)")
 
+    def _iter_archive_stream(self, stream, fmt):
+        """
+        Files of a streamed archive in the order they arrive
+
+        Yields:
+            tuple: (name, mtime, iterator of data chunks); the data must be
+            consumed before the next file is read
+        """
+        if fmt == 'zip':
+            for zinfo, data in iter_zip_stream(stream, self.DOWNLOAD_CHUNK_SIZE):
+                if not zinfo.is_dir():
+                    yield zinfo.filename, zip_entry_mtime(zinfo), data
+            return
+
+        with open_tar_stream(stream, fmt) as tar:
+            for member in tar:
+                if member.isfile():
+                    src = tar.extractfile(member)
+                    yield member.name, member.mtime, iter(lambda: src.read(self.DOWNLOAD_CHUNK_SIZE), b'')
+
+    def _extract_stream(self, response, fmt, extract_path):
+        """Extract an archive from a streaming response into extract_path, file by file as it arrives"""
+        total_size = int(response.headers.get('Content-Length') or 0)
+        real_extract = os.path.realpath(extract_path)
+        next_report = 0.1
+        count = 0
+
+        for name, mtime, data in self._iter_archive_stream(response.raw, fmt):
+            # Same path traversal protection as for downloaded ZIP files
+            member_path = os.path.realpath(os.path.join(extract_path, name))
+            if not member_path.startswith(real_extract + os.sep):
+                print(f"跳过不安全的归档条目: {name}")
+                continue
+
+            os.makedirs(os.path.dirname(member_path), exist_ok=True)
+            with open(member_path, 'wb') as f:
+                for chunk in data:
+                    f.write(chunk)
+            os.utime(member_path, (mtime, mtime))
+            count += 1
+
+            received = response.raw.tell()
+            if total_size and received >= next_report * total_size:
+                print(f"下载并解压进度: {self._format_size(received)}/{self._format_size(total_size)} "
+                      f"({received / total_size * 100:.1f}%), {count} 个文件")
+                next_report = received / total_size + 0.1
+
+        print(f"共解压 {count} 个文件")
+
     def _format_size(self, size_bytes):
         """Format file size in human readable format"""
         if size_bytes == 0:
@@ -471,16 +1639,52 @@ def main():
                        default='auto', help='同步方法 (默认: auto)')
     parser.add_argument('--no-backup', action='store_true', help='ZIP同步时不备份现有数据')
     parser.add_argument('--timeout', '-t', type=int, default=30, help='请求超时时间 (秒)')
+    parser.add_argument('--batch-size', '-b', type=int, default=100, help='增量同步时每批下载的小文件数量')
+    parser.add_argument('--delta-threshold', type=int, default=1024 * 1024,
+                       help='不小于该大小 (字节) 的已有文件按块增量传输，0 为禁用')
+    parser.add_argument('--download-workers', '-w', type=int, default=SyncClient.DEFAULT_DOWNLOAD_WORKERS,
+                       help='增量同步时同时下载的文件数')
+    parser.add_argument('--follow', '-f', action='store_true', help='持续跟随服务器变更，按 Ctrl+C 退出')
+    parser.add_argument('--user', '-u', help='要同步的 SillyTavern 用户 (默认: 服务器的默认用户)')
+    parser.add_argument('--list-users', action='store_true', help='列出服务器上可同步的用户')
+    parser.add_argument('--list-backups', action='store_true', help='列出本地数据目录的备份')
+    parser.add_argument('--restore-backup', metavar='ID', help='用指定备份替换本地数据')
+    parser.add_argument('--keep-last', type=int, default=RetentionPolicy.keep_last, help='保留最近的备份数')
+    parser.add_argument('--keep-daily', type=int, default=RetentionPolicy.keep_daily, help='按天保留的备份数')
+    parser.add_argument('--keep-weekly', type=int, default=RetentionPolicy.keep_weekly, help='按周保留的备份数')
 
     args = parser.parse_args()
 
     try:
-        client = SyncClient(args.server_url, args.data_path, args.timeout)
+        client = SyncClient(args.server_url, args.data_path, args.timeout, batch_size=args.batch_size,
+                            delta_threshold=args.delta_threshold, user=args.user,
+                            download_workers=args.download_workers,
+                            backup_retention=RetentionPolicy(args.keep_last, args.keep_daily, args.keep_weekly))
+
+        if args.list_users:
+            for handle in client.get_remote_users():
+                print(handle)
+            return 0
+
+        if args.list_backups:
+            for snapshot in client.list_backups():
+                print(f"{snapshot['id']}  {snapshot['created']:%Y-%m-%d %H:%M:%S}")
+            return 0
+
+        if args.restore_backup:
+            return 0 if client.restore_backup(args.restore_backup) else 1
 
         # Choose sync method
         prefer_zip = args.method in ['zip', 'auto']
         backup = not args.no_backup
 
+        if args.follow:
+            try:
+                client.follow()
+            except KeyboardInterrupt:
+                client.stop_follow()
+            return 0
+
         if args.method == 'incremental':
             success = client.sync_incremental()
         elif args.method == 'zip':
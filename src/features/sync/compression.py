@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Compression Policy
+Decides per file whether archive entries are deflated or stored
+"""
+
+import math
+import os
+from collections import Counter
+from typing import Dict, Tuple
+
+
+# Formats that are already compressed, deflating them only burns CPU
+STORED_EXTENSIONS = {
+    'image': {'.png', '.webp', '.jpg', '.jpeg', '.gif', '.avif', '.heic'},
+    'audio': {'.mp3', '.ogg', '.opus', '.m4a', '.aac', '.flac'},
+    'video': {'.mp4', '.webm', '.mkv', '.mov'},
+    'archive': {'.zip', '.gz', '.7z', '.rar', '.xz', '.zst', '.br', '.woff', '.woff2'},
+}
+
+TEXT_EXTENSIONS = {
+    '.json', '.jsonl', '.txt', '.md', '.yaml', '.yml', '.css', '.js', '.html', '.csv', '.svg', '.xml'
+}
+
+# (offset, signature, category)
+MAGIC_SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image'),
+    (0, b'\xff\xd8\xff', 'image'),
+    (0, b'GIF8', 'image'),
+    (8, b'WEBP', 'image'),
+    (0, b'OggS', 'audio'),
+    (0, b'ID3', 'audio'),
+    (0, b'fLaC', 'audio'),
+    (4, b'ftyp', 'video'),
+    (0, b'\x1a\x45\xdf\xa3', 'video'),
+    (0, b'PK\x03\x04', 'archive'),
+    (0, b'\x1f\x8b', 'archive'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'archive'),
+    (0, b'\x28\xb5\x2f\xfd', 'archive'),
+]
+
+PROBE_SIZE = 4096
+# Shannon entropy (bits per byte) above which data is treated as incompressible
+ENTROPY_THRESHOLD = 7.5
+
+
+def shannon_entropy(data: bytes) -> float:
+    """Shannon entropy of a byte string in bits per byte"""
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+class CompressionPolicy:
+    """
+    Per-file compression decision for sync archives
+
+    Known compressed formats are stored as-is, chosen by extension, then magic
+    bytes, then an entropy probe of the first 4 KB. Everything else is deflated
+    at ``level``. Decisions only depend on file name and content, so archives
+    stay byte-for-byte reproducible.
+    """
+
+    def __init__(self, level: int = 6):
+        """
+        Initialize compression policy
+
+        Args:
+            level: Deflate level 1-9, 0 stores every file uncompressed
+        """
+        self.level = max(0, min(9, int(level)))
+
+    @property
+    def tag(self) -> str:
+        """Short identifier of the policy settings, part of archive validators"""
+        return f"l{self.level}"
+
+    def categorize(self, path: str, head: bytes) -> Tuple[str, bool]:
+        """
+        Classify a file
+
+        Args:
+            path: File path or archive name
+            head: First bytes of the file (up to PROBE_SIZE)
+
+        Returns:
+            tuple: (category, compress) where compress tells whether deflating is worthwhile
+        """
+        ext = os.path.splitext(path)[1].lower()
+        for category, extensions in STORED_EXTENSIONS.items():
+            if ext in extensions:
+                return category, False
+
+        if ext in TEXT_EXTENSIONS:
+            return 'text', True
+
+        for offset, signature, category in MAGIC_SIGNATURES:
+            if head[offset:offset + len(signature)] == signature:
+                return category, False
+
+        if len(head) >= 256 and shannon_entropy(head) > ENTROPY_THRESHOLD:
+            return 'binary', False
+
+        return 'other', True
+
+    def choose(self, path: str, head: bytes) -> Tuple[str, bool]:
+        """
+        Decide how to store a file
+
+        Returns:
+            tuple: (category, deflate) with deflate False when the level is 0
+        """
+        category, compress = self.categorize(path, head)
+        return category, compress and self.level > 0
+
+
+class CompressionStats:
+    """Raw vs. compressed byte counts per file category"""
+
+    def __init__(self):
+        self.categories: Dict[str, Dict[str, int]] = {}
+
+    def add(self, category: str, raw_size: int, compressed_size: int):
+        item = self.categories.setdefault(category, {'files': 0, 'raw': 0, 'compressed': 0})
+        item['files'] += 1
+        item['raw'] += raw_size
+        item['compressed'] += compressed_size
+
+    def summary_lines(self):
+        """Human readable lines, one per category"""
+        lines = []
+        for category, item in sorted(self.categories.items()):
+            ratio = item['compressed'] / item['raw'] if item['raw'] else 1.0
+            lines.append(
+                f"{category}: {item['files']} 个文件, {item['raw']} -> {item['compressed']} 字节 "
+                f"(压缩率 {ratio:.1%})"
+            )
+        return lines
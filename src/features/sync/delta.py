@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Delta Transfer
+rsync style block-signature delta used by the POST /delta endpoint
+
+The client splits its copy of a file into fixed-size blocks and sends a
+(weak, strong) checksum pair per block. The server slides a window over the
+current file with a rolling Adler-32, confirms weak hits with the strong
+checksum and answers with frames (see framing.py):
+
+    {"size": 5000000, "mtime": 1700000000.0, "hash": "..."}\\n
+    {"copy": 0, "count": 40}\\n                 blocks 0-39 of the client's copy
+    {"literal": 123}\\n<123 bytes>              new data
+    {"done": true}\\n
+
+A mid-file edit therefore costs the signature upload plus the changed bytes.
+"""
+
+import mmap
+import os
+import zlib
+import hashlib
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from features.sync.framing import copy_body, encode_header, read_header
+from features.sync.hashing import new_hasher
+
+
+BLOCK_SIZE_MIN = 2 * 1024
+BLOCK_SIZE_MAX = 64 * 1024
+STRONG_DIGEST_SIZE = 8
+# Literal data is sent in frames of at most this size
+LITERAL_CHUNK_SIZE = 64 * 1024
+# Unmatched data is scanned byte by byte in Python; past this run length the
+# delta is given up and the client downloads the file instead
+MAX_LITERAL_RUN = 2 * 1024 * 1024
+
+_ADLER_MOD = 65521
+
+
+class DeltaAborted(Exception):
+    """The delta would not be smaller than the file, fetch it whole instead"""
+
+
+def block_size_for(size: int) -> int:
+    """Block size for a file of ``size`` bytes, about sqrt(size) rounded to 1 KB"""
+    block_size = int(size ** 0.5) & ~1023
+    return max(BLOCK_SIZE_MIN, min(BLOCK_SIZE_MAX, block_size))
+
+
+def strong_checksum(data) -> str:
+    """Strong block checksum (truncated blake2b)"""
+    return hashlib.blake2b(data, digest_size=STRONG_DIGEST_SIZE).hexdigest()
+
+
+def file_signature(path: str, block_size: int) -> List[Tuple[int, str]]:
+    """
+    Compute the block signature of a file
+
+    Args:
+        path: File path
+        block_size: Block size, the last block may be shorter
+
+    Returns:
+        list: (adler32, strong checksum) per block
+    """
+    signature = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            signature.append((zlib.adler32(block), strong_checksum(block)))
+    return signature
+
+
+def iter_delta(data, signature: Sequence[Tuple[int, str]], block_size: int,
+               basis_size: int) -> Iterator[Tuple]:
+    """
+    Compute the operations that turn the basis file into ``data``
+
+    Args:
+        data: Bytes-like content of the new file (bytes or mmap)
+        signature: Block signature of the basis file
+        block_size: Block size the signature was computed with
+        basis_size: Size of the basis file, gives the length of its last block
+
+    Yields:
+        tuple: ('copy', first_block, count) or ('literal', bytes)
+
+    Raises:
+        DeltaAborted: An unmatched run exceeded MAX_LITERAL_RUN
+    """
+    block_count = len(signature)
+    last_len = basis_size - (block_count - 1) * block_size if block_count else 0
+    full_blocks = block_count if last_len == block_size else block_count - 1
+
+    weak_index: Dict[int, List[int]] = {}
+    for index in range(full_blocks):
+        weak_index.setdefault(signature[index][0], []).append(index)
+
+    size = len(data)
+    pos = 0
+    literal_start = 0
+    run_start = run_count = 0
+    a = b = None
+
+    def flush_literal(end):
+        for start in range(literal_start, end, LITERAL_CHUNK_SIZE):
+            yield 'literal', bytes(data[start:min(end, start + LITERAL_CHUNK_SIZE)])
+
+    while pos + block_size <= size:
+        if a is None:
+            checksum = zlib.adler32(data[pos:pos + block_size])
+            a, b = checksum & 0xffff, checksum >> 16
+
+        match = None
+        candidates = weak_index.get((b << 16) | a)
+        if candidates:
+            strong = strong_checksum(data[pos:pos + block_size])
+            # Prefer the block continuing the current copy run
+            expected = run_start + run_count
+            for index in sorted(candidates, key=lambda i: i != expected):
+                if signature[index][1] == strong:
+                    match = index
+                    break
+
+        if match is not None:
+            if literal_start < pos:
+                if run_count:
+                    yield 'copy', run_start, run_count
+                    run_count = 0
+                yield from flush_literal(pos)
+            if run_count and match == run_start + run_count:
+                run_count += 1
+            else:
+                if run_count:
+                    yield 'copy', run_start, run_count
+                run_start, run_count = match, 1
+            pos += block_size
+            literal_start = pos
+            a = None
+            continue
+
+        if pos - literal_start >= MAX_LITERAL_RUN:
+            raise DeltaAborted(f"超过 {MAX_LITERAL_RUN} 字节未匹配")
+
+        # Roll the window one byte forward
+        if pos + block_size < size:
+            out_byte, in_byte = data[pos], data[pos + block_size]
+            a = (a - out_byte + in_byte) % _ADLER_MOD
+            b = (b - block_size * out_byte + a - 1) % _ADLER_MOD
+        pos += 1
+
+    # The basis' short last block can only match the very end of the file
+    tail_start = size - last_len
+    if 0 < last_len < block_size and tail_start >= literal_start and \
+            strong_checksum(data[tail_start:size]) == signature[-1][1]:
+        if literal_start < tail_start:
+            if run_count:
+                yield 'copy', run_start, run_count
+                run_count = 0
+            yield from flush_literal(tail_start)
+        if run_count and run_start + run_count == block_count - 1:
+            run_count += 1
+        else:
+            if run_count:
+                yield 'copy', run_start, run_count
+            run_start, run_count = block_count - 1, 1
+        literal_start = size
+
+    if run_count and literal_start < size:
+        yield 'copy', run_start, run_count
+        run_count = 0
+    yield from flush_literal(size)
+    if run_count:
+        yield 'copy', run_start, run_count
+
+
+def iter_delta_frames(full_path: str, signature: Sequence[Tuple[int, str]], block_size: int,
+                      basis_size: int) -> Iterator[bytes]:
+    """
+    Stream the delta of a file against a client signature as frames
+
+    The file is memory mapped, so large files are scanned without being
+    loaded. If the delta is abandoned an ``error`` frame ends the stream.
+
+    Args:
+        full_path: Current file on the server
+        signature: Client block signature
+        block_size: Client block size
+        basis_size: Size of the client's copy
+
+    Yields:
+        bytes: Encoded frames
+    """
+    with open(full_path, 'rb') as f:
+        stat_info = os.fstat(f.fileno())
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat_info.st_size else b''
+        try:
+            hasher = new_hasher()
+            hasher.update(data)
+            yield encode_header({'size': len(data), 'mtime': stat_info.st_mtime, 'hash': hasher.hexdigest()})
+
+            try:
+                for op in iter_delta(data, signature, block_size, basis_size):
+                    if op[0] == 'copy':
+                        yield encode_header({'copy': op[1], 'count': op[2]})
+                    else:
+                        yield encode_header({'literal': len(op[1])})
+                        yield op[1]
+            except DeltaAborted as e:
+                yield encode_header({'error': str(e)})
+                return
+
+            yield encode_header({'done': True})
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def apply_delta(stream, basis, out, block_size: int) -> Optional[Dict]:
+    """
+    Rebuild a file from delta frames
+
+    Args:
+        stream: Buffered binary stream positioned at the first frame
+        basis: Readable, seekable binary file object of the old copy
+        out: Writable binary file object for the new copy
+        block_size: Block size of the signature that was sent
+
+    Returns:
+        dict: The leading header (size, mtime, hash) plus the ``hash`` of
+        the bytes actually written as ``written_hash``
+
+    Raises:
+        IOError: Truncated stream or the server abandoned the delta
+    """
+    header = read_header(stream)
+    if header is None or 'size' not in header:
+        raise IOError(f"增量响应无效: {header.get('error') if header else '空响应'}")
+
+    hasher = new_hasher()
+    while True:
+        frame = read_header(stream)
+        if frame is None:
+            raise IOError("增量响应被截断")
+        if frame.get('done'):
+            break
+        if 'error' in frame:
+            raise IOError(f"服务器放弃增量传输: {frame['error']}")
+
+        if 'copy' in frame:
+            basis.seek(frame['copy'] * block_size)
+            remaining = frame['count'] * block_size
+            while remaining > 0:
+                data = basis.read(min(LITERAL_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                out.write(data)
+                hasher.update(data)
+                remaining -= len(data)
+        else:
+            for chunk in copy_body(stream, frame['literal'], out):
+                hasher.update(chunk)
+
+    header['written_hash'] = hasher.hexdigest()
+    return header
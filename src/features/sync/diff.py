@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Diff
+Linear-time manifest comparison with rename and copy detection
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from features.sync.index import IndexEntry, ManifestIndex
+
+
+Pair = Tuple[Optional[Dict], Optional[IndexEntry]]
+
+
+@dataclass
+class SyncPlan:
+    """Operations that bring the local files in line with the remote ones"""
+
+    downloads: List[Dict] = field(default_factory=list)  # remote entries to transfer
+    deletes: List[str] = field(default_factory=list)  # local paths missing remotely
+    # (local source path, remote entry): rebuilt from a local file with the same content;
+    # copies keep their source, moves rename it and run after all copies
+    copies: List[Tuple[str, Dict]] = field(default_factory=list)
+    moves: List[Tuple[str, Dict]] = field(default_factory=list)
+    local_sizes: Dict[str, int] = field(default_factory=dict)  # sizes of changed local files
+
+    def __bool__(self) -> bool:
+        return bool(self.downloads or self.deletes or self.copies or self.moves)
+
+
+def merge_entries(remote_entries: Iterable[Dict], local_entries: Iterable[IndexEntry]) -> Iterator[Pair]:
+    """
+    Pair remote and local entries by path, both sorted by path
+
+    Yields:
+        tuple: (remote_entry, local_entry), None for the side missing the path
+    """
+    local_iter = iter(local_entries)
+    local = next(local_iter, None)
+    for remote in remote_entries:
+        while local is not None and local.path < remote['path']:
+            yield None, local
+            local = next(local_iter, None)
+        if local is not None and local.path == remote['path']:
+            yield remote, local
+            local = next(local_iter, None)
+        else:
+            yield remote, None
+    while local is not None:
+        yield None, local
+        local = next(local_iter, None)
+
+
+def plan_sync(pairs: Iterable[Pair], local_index: ManifestIndex) -> SyncPlan:
+    """
+    Decide what to do for paired remote/local entries
+
+    Files are compared by content hash when the remote entry has one (local
+    hashes are computed for same-size files only), otherwise by mtime. Remote
+    files whose content already exists locally are then turned into local
+    copies or renames, see find_local_sources().
+
+    Args:
+        pairs: (remote_entry, local_entry) tuples, None for a missing side
+        local_index: Index of the local data directory
+
+    Returns:
+        SyncPlan: Planned operations
+    """
+    plan = SyncPlan()
+    hash_pending = []
+
+    for remote_file, local_entry in pairs:
+        if remote_file is None:
+            # File exists locally but not remotely - delete
+            plan.deletes.append(local_entry.path)
+            continue
+
+        if local_entry is None:
+            # File exists remotely but not locally - download
+            plan.downloads.append(remote_file)
+            continue
+
+        plan.local_sizes[local_entry.path] = local_entry.size
+        if remote_file.get('hash'):
+            # Content hash available - download only real changes
+            if remote_file['size'] != local_entry.size:
+                plan.downloads.append(remote_file)
+            elif local_entry.hash is None:
+                # Same size, hash the local copy below in one parallel pass
+                hash_pending.append(remote_file)
+            elif local_entry.hash != remote_file['hash']:
+                plan.downloads.append(remote_file)
+        elif remote_file['mtime'] > local_entry.mtime:
+            # Remote file is newer - download
+            plan.downloads.append(remote_file)
+
+    if hash_pending:
+        local_index.ensure_hashes([f['path'] for f in hash_pending])
+        for remote_file in hash_pending:
+            local_entry = local_index.get(remote_file['path'])
+            if not local_entry or local_entry.hash != remote_file['hash']:
+                plan.downloads.append(remote_file)
+
+    find_local_sources(plan, local_index)
+    return plan
+
+
+def find_local_sources(plan: SyncPlan, local_index: ManifestIndex):
+    """
+    Move downloads whose content already exists locally to plan.copies / plan.moves
+
+    A file that is deleted locally while a new remote path has its hash was
+    renamed (or moved) on the server and is renamed locally instead of being
+    transferred again; further remote files with that hash, and files whose
+    content matches a file that stays, are copies. Files the plan rewrites
+    are never used as a source. Deleted files are hashed on demand when their
+    size matches a wanted file, other local files only count with a known hash.
+
+    Args:
+        plan: Plan from plan_sync(), changed in place
+        local_index: Index of the local data directory
+    """
+    wanted: Dict[str, List[Dict]] = {}
+    for remote_file in plan.downloads:
+        if remote_file.get('hash'):
+            wanted.setdefault(remote_file['hash'], []).append(remote_file)
+    if not wanted:
+        return
+
+    wanted_sizes = {files[0]['size'] for files in wanted.values()}
+    deleting = set(plan.deletes)
+    candidates = []
+    for path in plan.deletes:
+        entry = local_index.get(path)
+        if entry is not None and entry.size in wanted_sizes:
+            candidates.append(path)
+    if candidates:
+        local_index.ensure_hashes(candidates)
+
+    changing = {f['path'] for f in plan.downloads}
+    kept: Dict[str, str] = {}  # hash -> a local path that stays unchanged
+    gone: Dict[str, List[str]] = {}  # hash -> local paths about to be deleted
+    for entry in local_index.entries():
+        if entry.hash not in wanted or entry.path in changing:
+            continue
+        if entry.path in deleting:
+            gone.setdefault(entry.hash, []).append(entry.path)
+        else:
+            kept.setdefault(entry.hash, entry.path)
+
+    rebuilt = set()
+    moved = set()
+    for file_hash, remote_files in wanted.items():
+        renamed = gone.get(file_hash, [])
+        source = kept.get(file_hash) or (renamed[0] if renamed else None)
+        if source is None:
+            continue
+        for remote_file in remote_files:
+            if renamed:
+                path = renamed.pop()
+                plan.moves.append((path, remote_file))
+                moved.add(path)
+            else:
+                plan.copies.append((source, remote_file))
+            rebuilt.add(remote_file['path'])
+
+    if rebuilt:
+        plan.downloads = [f for f in plan.downloads if f['path'] not in rebuilt]
+        plan.deletes = [path for path in plan.deletes if path not in moved]
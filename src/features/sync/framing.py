@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Framing
+Framed multi-file response format used by the POST /files batch endpoint
+
+Each frame is a JSON header line followed by ``size`` raw bytes:
+
+    {"path": "chats/a.jsonl", "size": 123, "mtime": 1700000000.0}\\n<123 bytes>
+    {"path": "missing.json", "error": "File not found"}\\n
+    {"done": true, "count": 2}\\n
+
+The trailing ``done`` frame lets the reader tell a complete batch from a
+truncated one.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+
+FRAMES_MIMETYPE = 'application/x-st-sync-frames'
+
+
+def encode_header(header: Dict) -> bytes:
+    """Encode a frame header line"""
+    return json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def iter_file_frames(files: Iterable[Tuple[str, Optional[str], Optional[str]]],
+                     chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Stream files as frames
+
+    Args:
+        files: Iterable of (relative_path, full_path, error) tuples; a frame
+            carries either the file content or the error
+        chunk_size: Read size
+
+    Yields:
+        bytes: Encoded frame data
+    """
+    count = 0
+    for rel_path, full_path, error in files:
+        if error is None:
+            try:
+                src = open(full_path, 'rb')
+            except OSError as e:
+                error = str(e)
+
+        if error is not None:
+            yield encode_header({'path': rel_path, 'error': error})
+            continue
+
+        with src:
+            stat_info = os.fstat(src.fileno())
+            yield encode_header({'path': rel_path, 'size': stat_info.st_size, 'mtime': stat_info.st_mtime})
+
+            remaining = stat_info.st_size
+            while remaining > 0:
+                data = src.read(min(chunk_size, remaining))
+                if not data:
+                    # File shrank while streaming, the frame can't be completed
+                    raise IOError(f"文件在传输过程中被修改: {rel_path}")
+                remaining -= len(data)
+                yield data
+        count += 1
+
+    yield encode_header({'done': True, 'count': count})
+
+
+def read_header(stream) -> Optional[Dict]:
+    """
+    Read the next frame header
+
+    Args:
+        stream: Buffered binary stream
+
+    Returns:
+        dict: Header, or None at end of stream
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    if not line.endswith(b'\n'):
+        raise IOError("帧头不完整，响应被截断")
+    return json.loads(line.decode('utf-8'))
+
+
+def copy_body(stream, size: int, out, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Copy a frame body to a file object
+
+    Args:
+        stream: Buffered binary stream positioned at the body
+        size: Body size from the header
+        out: Writable binary file object
+        chunk_size: Read size
+
+    Yields:
+        bytes: Each copied chunk, so callers can hash it on the way
+    """
+    remaining = size
+    while remaining > 0:
+        data = stream.read(min(chunk_size, remaining))
+        if not data:
+            raise IOError("帧数据不完整，响应被截断")
+        out.write(data)
+        remaining -= len(data)
+        yield data
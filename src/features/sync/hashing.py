@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Hashing
+Content hashing helpers shared by the sync server and client
+"""
+
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+
+HASH_ALGORITHM = "blake2b-128"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def new_hasher():
+    """Create a hasher for HASH_ALGORITHM"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_file(path: str, limit: Optional[int] = None) -> str:
+    """
+    Hash file content
+
+    Args:
+        path: File path
+        limit: Only hash the first ``limit`` bytes
+
+    Returns:
+        str: Hex digest
+    """
+    with open(path, 'rb') as f:
+        return hash_stream(f, limit)
+
+
+def hash_stream(stream, limit: Optional[int] = None) -> str:
+    """
+    Hash data read from a binary stream, from its current position
+
+    Args:
+        stream: Readable binary file object
+        limit: Only hash the next ``limit`` bytes
+
+    Returns:
+        str: Hex digest
+    """
+    hasher = new_hasher()
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = HASH_CHUNK_SIZE if remaining is None else min(HASH_CHUNK_SIZE, remaining)
+        data = stream.read(size)
+        if not data:
+            break
+        hasher.update(data)
+        if remaining is not None:
+            remaining -= len(data)
+    return hasher.hexdigest()
+
+
+def default_hash_workers() -> int:
+    """Default worker count for parallel hashing"""
+    return min(8, os.cpu_count() or 1)
+
+
+def hash_files(paths: Iterable[str], workers: Optional[int] = None) -> Dict[str, str]:
+    """
+    Hash many files on a thread pool (hashlib releases the GIL for large buffers)
+
+    Args:
+        paths: File paths to hash
+        workers: Worker count (default: CPU count, at most 8)
+
+    Returns:
+        dict: path -> hex digest, files that can't be read are omitted
+    """
+    def safe_hash(path):
+        try:
+            return path, hash_file(path)
+        except OSError:
+            return path, None
+
+    paths = list(paths)
+    if not paths:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=workers or default_hash_workers()) as pool:
+        return {path: digest for path, digest in pool.map(safe_hash, paths) if digest is not None}
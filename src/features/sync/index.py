@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Manifest Index
+Persistent SQLite index of the sync data directory
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from features.sync.hashing import hash_files
+
+
+CACHE_DIR_NAME = "sync_cache"
+# os.DirEntry.stat() reports st_ino 0 on Windows while os.stat() fills it in
+_DIRENTRY_HAS_INODE = os.name != 'nt'
+
+
+def _inode(stat_info: os.stat_result) -> int:
+    """Inode part of the cache key, the same whether the stat came from scandir or os.stat()"""
+    return stat_info.st_ino if _DIRENTRY_HAS_INODE else 0
+
+
+def get_cache_dir() -> str:
+    """Get (and create) the launcher-side sync cache directory"""
+    cache_dir = os.path.join(os.getcwd(), CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def default_index_path(data_path: str, prefix: str = "manifest") -> str:
+    """
+    Build a per-data-directory database path inside the cache directory
+
+    Args:
+        data_path: Data directory the database belongs to
+        prefix: File name prefix
+
+    Returns:
+        str: Database file path
+    """
+    key = hashlib.sha1(os.path.realpath(data_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(get_cache_dir(), f"{prefix}_{key}.db")
+
+
+@dataclass
+class IndexEntry:
+    """Indexed metadata of a single file"""
+
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    hash: Optional[str] = None
+
+    @property
+    def mtime(self) -> float:
+        # Same rounding as os.stat().st_mtime so values compare equal
+        sec, nsec = divmod(self.mtime_ns, 1_000_000_000)
+        return sec + nsec * 1e-9
+
+    @property
+    def dir(self) -> str:
+        return self.path.rpartition('/')[0]
+
+    def key(self):
+        """Cache key a stored hash is valid for"""
+        return self.size, self.mtime_ns, self.inode
+
+    def to_manifest(self) -> Dict:
+        """Convert to the manifest entry format served by /manifest"""
+        item = {
+            'path': self.path,
+            'size': self.size,
+            'mtime': self.mtime,
+            'modified': datetime.fromtimestamp(self.mtime).isoformat(),
+            'is_dir': False
+        }
+        if self.hash:
+            item['hash'] = self.hash
+        return item
+
+
+class ManifestIndex:
+    """
+    Persistent file index for a data directory
+
+    Rows are keyed by relative path and hold size, mtime, inode and hash. A
+    refresh only re-lists directories whose mtime changed, so its cost grows with
+    the number of changed directories instead of the number of files.
+
+    Directory mtimes do not change when a file is rewritten in place, so every
+    ``verify_interval`` seconds a refresh re-stats all files to pick up such edits.
+
+    The stored hash doubles as a hash cache: it is dropped whenever the
+    (path, size, mtime_ns, inode) key of a row changes.
+
+    Every create, modify and delete found by a refresh is appended to a change
+    journal with a monotonic sequence number, so ``changes(since)`` answers in
+    time proportional to the number of changes. Only the newest
+    ``journal_size`` rows are kept.
+    """
+
+    SCHEMA_VERSION = "3"
+
+    def __init__(self, data_path: str, db_path: Optional[str] = None, verify_interval: float = 10.0,
+                 hash_workers: Optional[int] = None, journal_size: int = 100000):
+        """
+        Initialize manifest index
+
+        Args:
+            data_path: Data directory to index
+            db_path: SQLite database path (default: per-directory file in sync cache)
+            verify_interval: Seconds between full re-stat passes
+            hash_workers: Worker count for content hashing (default: CPU count, at most 8)
+            journal_size: Change journal rows to keep
+        """
+        self.data_path = os.path.abspath(data_path)
+        self.db_path = db_path or default_index_path(self.data_path)
+        self.verify_interval = verify_interval
+        self.hash_workers = hash_workers
+        self.journal_size = journal_size
+
+        self._lock = threading.RLock()
+        self._files: Dict[str, IndexEntry] = {}
+        self._dirs: Dict[str, int] = {}  # relative dir -> mtime_ns ('' is the root)
+        self._children: Dict[str, Set[str]] = {}  # relative dir -> child dirs
+        self._dir_files: Dict[str, Set[str]] = {}  # relative dir -> file paths
+        self._last_verify = 0.0
+        self._total_size = 0
+        self._refreshed_at: Optional[float] = None  # wall clock time of the last refresh
+        self._index_id = ""
+        self._generation = 0
+        self._journal_seq = 0  # sequence number of the newest journal row
+        self._journal_floor = 0  # rows up to this sequence number were pruned
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._init_db()
+        self._load()
+
+    def _init_db(self):
+        """Create tables, dropping them if the schema or data path changed"""
+        conn = self._conn
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get('schema') != self.SCHEMA_VERSION or meta.get('data_path') != self.data_path:
+            conn.execute("DROP TABLE IF EXISTS files")
+            conn.execute("DROP TABLE IF EXISTS dirs")
+            conn.execute("DROP TABLE IF EXISTS journal")
+            conn.execute("DELETE FROM meta")
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ('schema', self.SCHEMA_VERSION),
+                ('data_path', self.data_path),
+                ('index_id', uuid.uuid4().hex[:12]),
+                ('generation', '0'),
+                ('journal_floor', '0'),
+            ])
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                hash TEXT
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                op TEXT NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _load(self):
+        """Load the persisted index into memory"""
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        self._index_id = meta['index_id']
+        self._generation = int(meta['generation'])
+        self._journal_floor = int(meta['journal_floor'])
+        self._journal_seq = self._conn.execute("SELECT COALESCE(MAX(seq), ?) FROM journal",
+                                               (self._journal_floor,)).fetchone()[0]
+
+        for path, size, mtime_ns, inode, file_hash in self._conn.execute(
+                "SELECT path, size, mtime_ns, inode, hash FROM files"):
+            self._put(IndexEntry(path, size, mtime_ns, inode, file_hash))
+
+        for path, mtime_ns in self._conn.execute("SELECT path, mtime_ns FROM dirs"):
+            self._dirs[path] = mtime_ns
+            self._children.setdefault(path, set())
+
+        for path in self._dirs:
+            if path:
+                self._children.setdefault(path.rpartition('/')[0], set()).add(path)
+
+    def _put(self, entry: IndexEntry):
+        """Insert or replace an in-memory entry, keeping the counters current"""
+        old = self._files.get(entry.path)
+        if old is not None:
+            self._total_size -= old.size
+        self._files[entry.path] = entry
+        self._dir_files.setdefault(entry.dir, set()).add(entry.path)
+        self._total_size += entry.size
+
+    def _drop(self, path: str):
+        """Remove an in-memory entry, keeping the counters current"""
+        entry = self._files.pop(path, None)
+        if entry is not None:
+            self._dir_files.get(entry.dir, set()).discard(path)
+            self._total_size -= entry.size
+
+    def _abs(self, rel_path: str) -> str:
+        return os.path.join(self.data_path, rel_path) if rel_path else self.data_path
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Bring the index up to date with the file system
+
+        Args:
+            full: Re-stat every file even if its directory is unchanged
+
+        Returns:
+            int: Number of changed, added or removed files
+        """
+        with self._lock:
+            verify = full or time.monotonic() - self._last_verify >= self.verify_interval
+
+            upserts: Dict[str, IndexEntry] = {}
+            removed: List[str] = []
+            dir_updates: Dict[str, int] = {}
+            seen_dirs: Set[str] = set()
+            stack = ['']
+
+            while stack:
+                rel_dir = stack.pop()
+                try:
+                    dir_mtime = os.stat(self._abs(rel_dir)).st_mtime_ns
+                except OSError:
+                    continue
+                seen_dirs.add(rel_dir)
+
+                if not verify and self._dirs.get(rel_dir) == dir_mtime:
+                    stack.extend(self._children.get(rel_dir, ()))
+                    continue
+
+                subdirs = self._scan_dir(rel_dir, upserts, removed)
+                if subdirs is None:
+                    seen_dirs.discard(rel_dir)
+                    continue
+                dir_updates[rel_dir] = dir_mtime
+                self._children[rel_dir] = subdirs
+                stack.extend(subdirs)
+
+            # Directories that disappeared take their files with them; files
+            # recorded by update_file() may live in directories not listed yet
+            gone_dirs = (set(self._dirs) | set(self._dir_files)) - seen_dirs
+            for rel_dir in gone_dirs:
+                removed.extend(self._dir_files.get(rel_dir, ()))
+
+            for path in removed:
+                self._drop(path)
+            for rel_dir in gone_dirs:
+                self._dirs.pop(rel_dir, None)
+                self._children.pop(rel_dir, None)
+                self._dir_files.pop(rel_dir, None)
+            created = {path for path in upserts if path not in self._files}
+            for entry in upserts.values():
+                self._put(entry)
+            self._dirs.update(dir_updates)
+
+            if upserts or removed or dir_updates or gone_dirs:
+                self._persist(upserts, removed, dir_updates, gone_dirs, created)
+
+            if verify:
+                self._last_verify = time.monotonic()
+            self._refreshed_at = time.time()
+
+            return len(upserts) + len(removed)
+
+    def _scan_dir(self, rel_dir: str, upserts: Dict[str, IndexEntry], removed: List[str]) -> Optional[Set[str]]:
+        """
+        List one directory and record file changes
+
+        Returns:
+            set: Relative paths of child directories, or None if the directory can't be read
+        """
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        subdirs = set()
+        listed = set()
+
+        try:
+            with os.scandir(self._abs(rel_dir)) as it:
+                for entry in it:
+                    name = entry.name
+                    if name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.add(prefix + name)
+                            continue
+                        if not entry.is_file() or name.endswith('.tmp'):
+                            continue
+                        stat_info = entry.stat()
+                    except OSError:
+                        # Skip files that can't be accessed
+                        continue
+
+                    path = prefix + name
+                    listed.add(path)
+                    known = self._files.get(path)
+                    if (known is None or known.size != stat_info.st_size
+                            or known.mtime_ns != stat_info.st_mtime_ns
+                            or known.inode != _inode(stat_info)):
+                        upserts[path] = IndexEntry(path, stat_info.st_size, stat_info.st_mtime_ns, _inode(stat_info))
+        except OSError:
+            return None
+
+        removed.extend(p for p in self._dir_files.get(rel_dir, ()) if p not in listed)
+        return subdirs
+
+    def _persist(self, upserts, removed, dir_updates, gone_dirs, created=()):
+        """Write index changes and their journal rows to SQLite in one transaction"""
+        with self._conn:
+            if upserts or removed:
+                self._generation += 1
+                self._conn.execute("UPDATE meta SET value = ? WHERE key = 'generation'", (str(self._generation),))
+                self._append_journal(
+                    [(path, 'delete') for path in removed] +
+                    [(path, 'create' if path in created else 'modify') for path in upserts]
+                )
+            if removed:
+                self._conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+            if gone_dirs:
+                self._conn.executemany("DELETE FROM dirs WHERE path = ?", [(d,) for d in gone_dirs])
+            if upserts:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash) VALUES (?, ?, ?, ?, ?)",
+                    [(e.path, e.size, e.mtime_ns, e.inode, e.hash) for e in upserts.values()]
+                )
+            if dir_updates:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)",
+                    list(dir_updates.items())
+                )
+
+    def _append_journal(self, rows):
+        """Append (path, op) rows to the change journal and prune old rows"""
+        self._conn.executemany("INSERT INTO journal (path, op) VALUES (?, ?)", rows)
+        self._journal_seq = self._conn.execute("SELECT MAX(seq) FROM journal").fetchone()[0]
+
+        floor = self._journal_seq - self.journal_size
+        if floor > self._journal_floor:
+            self._conn.execute("DELETE FROM journal WHERE seq <= ?", (floor,))
+            self._conn.execute("UPDATE meta SET value = ? WHERE key = 'journal_floor'", (str(floor),))
+            self._journal_floor = floor
+
+    def ensure_hashes(self, paths: Optional[Iterable[str]] = None) -> int:
+        """
+        Compute content hashes for entries that don't have one yet
+
+        Hashing runs on a worker pool without holding the index lock. A result
+        is only stored if the file still has the key it had before hashing.
+
+        Args:
+            paths: Relative paths to hash (default: all entries)
+
+        Returns:
+            int: Number of newly computed hashes
+        """
+        with self._lock:
+            if paths is None:
+                pending = [e for e in self._files.values() if not e.hash]
+            else:
+                pending = [self._files[p] for p in paths if p in self._files and not self._files[p].hash]
+
+        if not pending:
+            return 0
+
+        digests = hash_files((self._abs(e.path) for e in pending), self.hash_workers)
+
+        updates = []
+        with self._lock:
+            for entry in pending:
+                digest = digests.get(self._abs(entry.path))
+                current = self._files.get(entry.path)
+                if not digest or current is None or current.key() != entry.key():
+                    continue
+                try:
+                    stat_info = os.stat(self._abs(entry.path))
+                except OSError:
+                    continue
+                if (stat_info.st_size, stat_info.st_mtime_ns, _inode(stat_info)) != entry.key():
+                    # Changed while hashing, the next refresh picks it up
+                    continue
+                current.hash = digest
+                updates.append((digest, entry.path, entry.size, entry.mtime_ns, entry.inode))
+
+            if updates:
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE files SET hash = ? WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                        updates
+                    )
+
+        return len(updates)
+
+    def update_file(self, rel_path: str, file_hash: Optional[str] = None):
+        """
+        Record a file the caller just wrote, optionally with its known content hash
+
+        Args:
+            rel_path: Relative path with forward slashes
+            file_hash: Content hash, saves rehashing files received from a server
+        """
+        try:
+            stat_info = os.stat(self._abs(rel_path))
+        except OSError:
+            return
+
+        entry = IndexEntry(rel_path, stat_info.st_size, stat_info.st_mtime_ns, _inode(stat_info), file_hash)
+        with self._lock:
+            created = set() if rel_path in self._files else {rel_path}
+            self._put(entry)
+            self._persist({rel_path: entry}, [], {}, set(), created)
+
+    @property
+    def version(self) -> str:
+        """
+        Opaque version of the indexed file set
+
+        Changes whenever a file is added, modified or removed, and is unique
+        across index rebuilds, so it can serve as a strong HTTP validator.
+        """
+        with self._lock:
+            return f"{self._index_id}.{self._generation}"
+
+    @property
+    def journal_id(self) -> str:
+        """Identity of the change journal, sequence numbers are only comparable within it"""
+        return self._index_id
+
+    def journal_cursor(self) -> int:
+        """Sequence number of the newest journal row (0 if none)"""
+        with self._lock:
+            return self._journal_seq
+
+    def changes(self, since: int) -> Optional[List[Dict]]:
+        """
+        Files changed after journal position ``since``, latest state per path
+
+        Args:
+            since: Journal cursor from an earlier manifest or changes call
+
+        Returns:
+            list: ``{'path', 'op'}`` dicts in path order where op is 'create',
+            'modify' or 'delete'; non-deleted entries also carry size, mtime
+            and the cached hash. None if ``since`` is no longer covered by
+            the journal and the caller has to compare full manifests.
+        """
+        with self._lock:
+            if since < self._journal_floor or since > self._journal_seq:
+                return None
+
+            rows = self._conn.execute("""
+                SELECT path, op FROM journal
+                WHERE seq IN (SELECT MAX(seq) FROM journal WHERE seq > ? GROUP BY path)
+                ORDER BY path
+            """, (since,)).fetchall()
+
+            changes = []
+            for path, op in rows:
+                entry = self._files.get(path)
+                if op == 'delete' or entry is None:
+                    changes.append({'path': path, 'op': 'delete'})
+                    continue
+                item = {'path': path, 'op': op, 'size': entry.size, 'mtime': entry.mtime}
+                if entry.hash:
+                    item['hash'] = entry.hash
+                changes.append(item)
+            return changes
+
+    def get(self, rel_path: str) -> Optional[IndexEntry]:
+        """Get the indexed entry for a relative path"""
+        with self._lock:
+            return self._files.get(rel_path)
+
+    def entries(self) -> List[IndexEntry]:
+        """Get a snapshot of all indexed entries, sorted by path"""
+        with self._lock:
+            return sorted(self._files.values(), key=lambda e: e.path)
+
+    def manifest(self, with_hash: bool = False, full: bool = False) -> List[Dict]:
+        """
+        Refresh the index and return it in manifest format
+
+        Args:
+            with_hash: Make sure every entry carries a content hash
+            full: Re-stat every file during the refresh
+        """
+        self.refresh(full=full)
+        if with_hash:
+            self.ensure_hashes()
+        return [entry.to_manifest() for entry in self.entries()]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._files)
+
+    def total_size(self) -> int:
+        """Total size of all indexed files (maintained incrementally)"""
+        with self._lock:
+            return self._total_size
+
+    def stats(self) -> Dict:
+        """
+        File count and total size without touching the file system
+
+        Deliberately lock-free so it never waits for a running refresh; the
+        counters are at most one refresh behind.
+
+        Returns:
+            dict: file_count, total_size and updated_at (ISO time of the last refresh, None if never)
+        """
+        refreshed_at = self._refreshed_at
+        return {
+            'file_count': len(self._files),
+            'total_size': self._total_size,
+            'updated_at': datetime.fromtimestamp(refreshed_at).isoformat() if refreshed_at else None
+        }
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
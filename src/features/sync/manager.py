@@ -14,6 +14,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Optional, List, Dict, Tuple
 
+from features.sync.backup import RetentionPolicy
+
 try:
     from features.sync.server import SyncServer
     from features.sync.client import SyncClient
@@ -52,8 +54,10 @@ class DataSyncManager:
         self.config_manager = config_manager
         self.sync_server: Optional[SyncServer] = None
         self.sync_thread: Optional[threading.Thread] = None
+        self.follow_client: Optional[SyncClient] = None
+        self.follow_thread: Optional[threading.Thread] = None
         self.is_server_running = False
-        self.sync_status = "idle"  # idle, syncing, server, error
+        self.sync_status = "idle"  # idle, syncing, following, server, error
         self.last_sync_info = {}
 
         # Get the global network manager
@@ -112,6 +116,17 @@ class DataSyncManager:
             default_lan_ip = self.network_manager.get_local_ip() if self.network_manager else None
             default_lan_ip = default_lan_ip or "192.168.1.100"
             self.server_host = self.config_manager.get("sync.host", default_lan_ip)
+            self.batch_size = self.config_manager.get("sync.batch_size", 100)
+            self.deflate_level = self.config_manager.get("sync.deflate_level", 6)
+            self.compress_workers = self.config_manager.get("sync.compress_workers", 0)
+            self.server_engine = self.config_manager.get("sync.engine", "flask")
+            self.delta_threshold = self.config_manager.get("sync.delta_threshold", 1024 * 1024)
+            self.download_workers = self.config_manager.get("sync.download_workers", 4)
+            self.backup_retention = RetentionPolicy(
+                self.config_manager.get("sync.backup_keep_last", 5),
+                self.config_manager.get("sync.backup_keep_daily", 7),
+                self.config_manager.get("sync.backup_keep_weekly", 4)
+            )
         else:
             self.server_enabled = False
             self.server_port = 9999
@@ -119,6 +134,13 @@ class DataSyncManager:
             fallback_lan_ip = self.network_manager.get_local_ip() if self.network_manager else None
             fallback_lan_ip = fallback_lan_ip or "192.168.1.100"
             self.server_host = fallback_lan_ip
+            self.batch_size = 100
+            self.deflate_level = 6
+            self.compress_workers = 0
+            self.server_engine = "flask"
+            self.delta_threshold = 1024 * 1024
+            self.download_workers = 4
+            self.backup_retention = RetentionPolicy()
 
     def _save_config(self):
         """Save sync configuration"""
@@ -230,13 +252,14 @@ class DataSyncManager:
             self._log(f"网络扫描失败: {e}", 'error')
             return []
 
-    def start_sync_server(self, port: int = None, host: str = None) -> bool:
+    def start_sync_server(self, port: int = None, host: str = None, engine: str = None) -> bool:
         """
         Start sync server
 
         Args:
             port: Server port (default uses configured port)
             host: Server host (default uses configured host)
+            engine: HTTP engine, 'flask' (werkzeug) or 'aiohttp' (default uses configured engine)
 
         Returns:
             bool: Success status
@@ -257,26 +280,41 @@ class DataSyncManager:
             self.sync_server = SyncServer(
                 data_path=self.data_dir,
                 port=self.server_port,
-                host=self.server_host
+                host=self.server_host,
+                compress_level=self.deflate_level,
+                compress_workers=self.compress_workers or None
             )
 
             # Set log callback to pass through messages to UI
             self.sync_server.set_ui_log_callback(self._log)
 
+            engine = engine or self.server_engine
+            if engine == 'aiohttp':
+                try:
+                    from features.sync.aio_server import AioSyncEngine
+                except ImportError as e:
+                    self._log(f"aiohttp 不可用，改用 Flask 服务器: {e}", 'warning')
+                    engine = 'flask'
+
             # 使用可关闭的 Flask 服务器
             from werkzeug.serving import make_server
 
             def run_server():
-                self.sync_server.httpd = make_server(
-                    self.server_host,
-                    self.server_port,
-                    self.sync_server.app,
-                    threaded=True
-                )
+                if engine == 'aiohttp':
+                    # 异步引擎，适合多台设备同时同步
+                    self.sync_server.httpd = AioSyncEngine(self.sync_server, self.server_host, self.server_port)
+                else:
+                    self.sync_server.httpd = make_server(
+                        self.server_host,
+                        self.server_port,
+                        self.sync_server.app,
+                        threaded=True
+                    )
                 self.sync_server.httpd.serve_forever()
 
             self.sync_thread = threading.Thread(target=run_server, daemon=False)
             self.sync_thread.start()
+            self.sync_server.start_background_refresh()
 
             self.is_server_running = True
             self.server_enabled = True
@@ -290,6 +328,7 @@ class DataSyncManager:
             self._log(f"服务器地址: http://{local_ip}:{self.server_port}", 'info')
             self._log(f"本地地址: http://localhost:{self.server_port}", 'info')
             self._log(f"数据路径: {self.data_dir}", 'info')
+            self._log(f"服务器引擎: {engine}", 'info')
 
             return True
 
@@ -318,6 +357,8 @@ class DataSyncManager:
                 if self.sync_thread and self.sync_thread.is_alive():
                     self.sync_thread.join(timeout=5.0)
 
+                self.sync_server.stop_background_refresh()
+                self.sync_server.close_indexes()
                 self._log("数据同步服务已停止", 'info')
             else:
                 # 回退到原有方法
@@ -334,7 +375,14 @@ class DataSyncManager:
             self._log(f"停止同步服务器失败: {e}", 'error')
             return False
 
-    def sync_from_server(self, server_url: str, method: str = 'auto', backup: bool = True) -> bool:
+    def _user_data_dir(self, user: Optional[str]) -> str:
+        """Local data directory of a SillyTavern user, data/<user> next to the default one"""
+        if not user:
+            return self.data_dir
+        return os.path.join(os.path.dirname(os.path.abspath(self.data_dir)), user)
+
+    def sync_from_server(self, server_url: str, method: str = 'auto', backup: bool = True,
+                         user: Optional[str] = None) -> bool:
         """
         Sync data from remote server
 
@@ -342,6 +390,7 @@ class DataSyncManager:
             server_url: Remote server URL
             method: Sync method ('auto', 'zip', 'incremental')
             backup: Whether to backup existing data
+            user: SillyTavern user to sync (default: the server's default user)
 
         Returns:
             bool: Success status
@@ -354,10 +403,14 @@ class DataSyncManager:
             self.sync_status = "syncing"
 
             # Ensure data directory exists
-            os.makedirs(self.data_dir, exist_ok=True)
+            data_dir = self._user_data_dir(user)
+            os.makedirs(data_dir, exist_ok=True)
 
             # Initialize sync client
-            client = SyncClient(server_url, self.data_dir)
+            client = SyncClient(server_url, data_dir, batch_size=self.batch_size,
+                                delta_threshold=self.delta_threshold, user=user,
+                                download_workers=self.download_workers,
+                                backup_retention=self.backup_retention)
 
             # Check server health
             if not client.check_server_health():
@@ -409,6 +462,74 @@ class DataSyncManager:
             self.sync_status = "error"
             return False
 
+    def start_follow(self, server_url: str, user: Optional[str] = None) -> bool:
+        """
+        Keep the data directory in step with a remote server in the background
+
+        Args:
+            server_url: Remote server URL
+            user: SillyTavern user to follow (default: the server's default user)
+
+        Returns:
+            bool: Success status
+        """
+        if self.is_server_running:
+            app_logger.error("错误: 服务器正在运行时无法同步数据")
+            return False
+        if self.follow_thread and self.follow_thread.is_alive():
+            self._log("跟随同步已在运行", 'warning')
+            return False
+
+        data_dir = self._user_data_dir(user)
+        os.makedirs(data_dir, exist_ok=True)
+        self.follow_client = SyncClient(server_url, data_dir, batch_size=self.batch_size,
+                                        delta_threshold=self.delta_threshold, user=user,
+                                        download_workers=self.download_workers,
+                                        backup_retention=self.backup_retention)
+        if not self.follow_client.check_server_health():
+            self._log("无法连接到服务器或服务器不健康", 'error')
+            self.follow_client.close()
+            self.follow_client = None
+            return False
+
+        def on_change(success):
+            self.sync_status = "following" if success else "error"
+            self.last_sync_info = {
+                'server_url': server_url,
+                'method': 'follow',
+                'timestamp': datetime.now().isoformat(),
+                'success': success
+            }
+
+        self.follow_thread = threading.Thread(
+            target=self.follow_client.follow, kwargs={'on_change': on_change}, daemon=True
+        )
+        self.follow_thread.start()
+        self.sync_status = "following"
+        self._log(f"开始跟随同步: {server_url}")
+        return True
+
+    def stop_follow(self) -> bool:
+        """
+        Stop the background follow started by start_follow()
+
+        Returns:
+            bool: Success status
+        """
+        if not self.follow_client:
+            return False
+
+        self.follow_client.stop_follow()
+        if self.follow_thread and self.follow_thread.is_alive():
+            self.follow_thread.join(timeout=5.0)
+        # Releases the HTTP session and the local index database
+        self.follow_client.close()
+        self.follow_client = None
+        self.follow_thread = None
+        self.sync_status = "idle"
+        self._log("已停止跟随同步")
+        return True
+
     def get_data_info(self) -> Dict:
         """Get data directory information"""
         info = {
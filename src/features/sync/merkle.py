@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Merkle Tree
+Per-directory hashes over the content hashes of the indexed files
+"""
+
+from typing import Dict, Iterable, List, Optional, Set
+
+from features.sync.hashing import new_hasher
+from features.sync.index import IndexEntry
+
+
+class MerkleTree:
+    """
+    Directory hashes of a file set
+
+    A directory hash covers the names and content hashes of its files and the
+    names and hashes of its subdirectories, so two trees with equal root
+    hashes hold identical files and any difference can be located by
+    descending only into directories whose hashes differ. Directories without
+    files (at any depth) do not appear, matching what sync transfers.
+
+    A directory holding a file without content hash (one that changed while
+    being hashed, say) has no hash at all, as do its ancestors, so it is
+    always treated as different instead of being compared on names alone.
+    """
+
+    def __init__(self, entries: Iterable[IndexEntry]):
+        """
+        Build the tree
+
+        Args:
+            entries: Index entries with content hashes (see ManifestIndex.ensure_hashes)
+        """
+        self.files: Dict[str, Dict[str, IndexEntry]] = {}  # dir -> file name -> entry
+        self.subdirs: Dict[str, Set[str]] = {'': set()}  # dir -> child dir paths
+        # None for directories holding a file without content hash (at any depth)
+        self.hashes: Dict[str, Optional[str]] = {}
+
+        for entry in entries:
+            rel_dir, _, name = entry.path.rpartition('/')
+            self.files.setdefault(rel_dir, {})[name] = entry
+            child = rel_dir
+            while child not in self.subdirs:
+                self.subdirs[child] = set()
+                child = child.rpartition('/')[0]
+
+        for rel_dir in list(self.subdirs):
+            if rel_dir:
+                self.subdirs[rel_dir.rpartition('/')[0]].add(rel_dir)
+
+        # Children before parents
+        for rel_dir in sorted(self.subdirs, key=lambda p: p.count('/') + 1 if p else 0, reverse=True):
+            self.hashes[rel_dir] = self._hash_dir(rel_dir)
+
+    def _hash_dir(self, rel_dir: str) -> Optional[str]:
+        files = self.files.get(rel_dir, {})
+        children = self.subdirs[rel_dir]
+        if any(not entry.hash for entry in files.values()) or any(self.hashes[c] is None for c in children):
+            # Unknown content must never compare equal, see hashes
+            return None
+
+        items = [(name, b'f', entry.hash.encode('ascii')) for name, entry in files.items()]
+        items.extend((child.rpartition('/')[2], b'd', self.hashes[child].encode('ascii')) for child in children)
+
+        hasher = new_hasher()
+        for name, kind, digest in sorted(items):
+            hasher.update(kind + b'\0' + name.encode('utf-8') + b'\0' + digest + b'\n')
+        return hasher.hexdigest()
+
+    def node(self, rel_dir: str) -> Optional[Dict]:
+        """
+        One directory level as served by /tree
+
+        Args:
+            rel_dir: Relative directory path, '' for the root
+
+        Returns:
+            dict: path, hash, ``dirs`` (name, hash) and ``files`` (manifest
+            entries), or None if the directory holds no files
+        """
+        if rel_dir not in self.subdirs:
+            return None
+        dirs: List[Dict] = [
+            {'name': child.rpartition('/')[2], 'hash': self.hashes[child]}
+            for child in sorted(self.subdirs[rel_dir])
+        ]
+        files = [
+            {'path': entry.path, 'size': entry.size, 'mtime': entry.mtime, 'hash': entry.hash}
+            for _, entry in sorted(self.files.get(rel_dir, {}).items())
+        ]
+        return {'path': rel_dir, 'hash': self.hashes[rel_dir], 'dirs': dirs, 'files': files}
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync Metrics
+Minimal Prometheus text-format metrics for the sync server (GET /metrics)
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+METRICS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds, from a cached manifest hit up to a multi-GB archive build
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, or is read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        if self.function is not None:
+            try:
+                yield f"{self.name} {_format_value(self.function())}"
+            except Exception:
+                # A failing callback must not break the whole scrape
+                pass
+            return
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class SyncMetrics(MetricsRegistry):
+    """Metrics recorded by SyncServer and its HTTP engines"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = self.register(Counter(
+            'sync_http_requests_total', 'HTTP requests handled', ('route', 'method', 'status')))
+        self.request_duration = self.register(Histogram(
+            'sync_http_request_duration_seconds', 'Time from request start until the response body was sent',
+            ('route',)))
+        self.response_bytes = self.register(Counter(
+            'sync_http_response_bytes_total', 'Response bytes sent (the aiohttp engine includes headers)',
+            ('route',)))
+        self.active_requests = self.register(Gauge(
+            'sync_http_active_requests', 'Requests in progress, including streaming responses'))
+        self.archive_build = self.register(Histogram(
+            'sync_archive_build_seconds', 'Time to build an archive snapshot', ('format',)))
+        self.manifest_generation = self.register(Histogram(
+            'sync_manifest_generation_seconds', 'Time to generate a manifest representation', ('variant',)))
+        self.index_refresh = self.register(Histogram(
+            'sync_index_refresh_seconds', 'Time of background index refreshes'))
+        self.cache_lookups = self.register(Counter(
+            'sync_cache_lookups_total', 'Cache lookups by cache and result (hit, miss, wait)',
+            ('cache', 'result')))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]) -> Gauge:
+        """Register a gauge read from ``function`` at scrape time"""
+        return self.register(Gauge(name, documentation, function=function))
+
+    def request_finished(self, route: str, method: str, status, duration: float, sent: int):
+        """Record a completed request"""
+        self.requests.inc(route=route, method=method, status=status)
+        self.request_duration.observe(duration, route=route)
+        self.response_bytes.inc(sent, route=route)
+
+
+class MetricsMiddleware:
+    """
+    WSGI middleware that feeds SyncMetrics
+
+    The request is finished when the server closes the response iterable, so
+    streamed archives count their full transfer time and size. Paths outside
+    ``routes`` are recorded as ``other`` to keep label cardinality bounded.
+    """
+
+    def __init__(self, app, metrics: SyncMetrics, routes: Callable[[], Iterable[str]]):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        path = environ.get('PATH_INFO', '/')
+        route = path if path in self.routes() else 'other'
+        method = environ.get('REQUEST_METHOD', '-')
+        status = ['-']
+
+        def counting_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        self.metrics.active_requests.inc()
+        try:
+            body = self.app(environ, counting_start_response)
+        except Exception:
+            self.metrics.active_requests.dec()
+            self.metrics.request_finished(route, method, '500', time.perf_counter() - start, 0)
+            raise
+
+        def finished(sent):
+            self.metrics.active_requests.dec()
+            self.metrics.request_finished(route, method, status[0], time.perf_counter() - start, sent)
+
+        return _CountingBody(body, finished)
+
+
+class _CountingBody:
+    """WSGI response iterable that counts the bytes sent and reports them on close()"""
+
+    def __init__(self, body, on_close: Callable[[int], None]):
+        self.body = body
+        self.on_close = on_close
+        self.sent = 0
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self.body, 'close', None)
+            if close:
+                close()
+        finally:
+            self.on_close(self.sent)
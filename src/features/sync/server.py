@@ -6,10 +6,12 @@ Flask HTTP service for providing SillyTavern user data to clients
 
 import os
 import json
-import zipfile
-import io
 import hashlib
 import sys
+import tempfile
+import contextvars
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from flask import Flask, request, jsonify, send_file, Response
@@ -18,6 +20,22 @@ import time
 import logging
 from werkzeug.serving import WSGIRequestHandler
 
+from features.sync.compression import CompressionPolicy
+from features.sync.delta import BLOCK_SIZE_MAX, BLOCK_SIZE_MIN, iter_delta_frames
+from features.sync.framing import FRAMES_MIMETYPE, iter_file_frames
+from features.sync.hashing import HASH_ALGORITHM, hash_stream
+from features.sync.index import ManifestIndex, get_cache_dir
+from features.sync.merkle import MerkleTree
+from features.sync.metrics import METRICS_MIMETYPE, MetricsMiddleware, SyncMetrics
+from features.sync.tarstream import TAR_MIMETYPES, TarStream, available_formats
+from features.sync.zipstream import ParallelZipStream
+
+
+MANIFEST_NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Handle of the user the current request (or refresh pass) works on, None for the default user
+_current_user = contextvars.ContextVar('sync_user', default=None)
+
 
 class UILogHandler(logging.Handler):
     """Custom log handler to redirect Flask logs to UI log system"""
@@ -119,15 +137,51 @@ class CustomRequestHandler(WSGIRequestHandler):
         super().log(type, message, *args)
 
 
+class _UserData:
+    """Per-user state: data directory, manifest index and serialized caches"""
+
+    def __init__(self, handle, data_path, index_path=None):
+        self.handle = handle
+        self.data_path = data_path
+        # Persistent manifest index, only changed directories are re-listed
+        self.index = ManifestIndex(data_path, db_path=index_path)
+        # Last serialized manifest per variant: {with_hash: (etag, body)}
+        self.manifest_cache = {}
+        self.tree_cache = None  # (index version, journal cursor, MerkleTree)
+
+
 class SyncServer:
-    def __init__(self, data_path=None, port=9999, host=None):
+    # Upper bound of paths accepted by one POST /files request
+    MAX_BATCH_FILES = 1000
+    # Index refresh interval while /events listeners are connected
+    EVENTS_REFRESH_INTERVAL = 0.5
+    # Seconds between keepalive comments on an idle /events stream
+    EVENTS_KEEPALIVE = 15.0
+    # Part of the /zip ETag, bump whenever the archive byte layout changes
+    ARCHIVE_FORMAT = "zip3"
+    # Same for the tar transports
+    TAR_ARCHIVE_FORMAT = "tar1"
+
+    def __init__(self, data_path=None, port=9999, host=None, index_path=None, compress_level=6,
+                 refresh_interval=2.0, compress_workers=None, multi_user=None):
         """
         Initialize sync server
 
+        In multi-user mode every user directory next to ``data_path``
+        (``data/<handle>``) is served as well, selected with ``?user=<handle>``
+        on any route. Their indexes are opened on first use, so serving one
+        user never walks the trees of the others.
+
         Args:
-            data_path (str): Path to SillyTavern data directory
+            data_path (str): Path to the default user's SillyTavern data directory
             port (int): Server port
             host (str): Server host address
+            index_path (str): Manifest index database path (default: in sync cache)
+            compress_level (int): Deflate level for archives (0 stores everything)
+            refresh_interval (float): Seconds between background index refreshes
+            compress_workers (int): Archive compression threads (default: CPU count)
+            multi_user (bool): Serve the other users too (default: only when
+                ``data_path`` lies in the ``data`` directory of a SillyTavern install)
         """
         self.app = Flask(__name__)
         self.port = port
@@ -136,7 +190,7 @@ class SyncServer:
             self.host = self._get_lan_ip() or "192.168.1.100"
         else:
             self.host = host
-        self.data_path = data_path or self._find_data_path()
+        data_path = data_path or self._find_data_path()
         self.running = False
         self.server_thread = None
         self.httpd = None  # Werkzeug HTTP 服务器引用，用于优雅关闭
@@ -145,11 +199,37 @@ class SyncServer:
         self._ui_log_callback = None
 
         # Validate data path
-        if not os.path.exists(self.data_path):
-            raise FileNotFoundError(f"数据目录不存在: {self.data_path}")
+        if not os.path.exists(data_path):
+            raise FileNotFoundError(f"数据目录不存在: {data_path}")
+
+        # SillyTavern keeps every user in data/<handle>
+        self.data_root = os.path.dirname(os.path.abspath(data_path))
+        if multi_user is None:
+            multi_user = self._is_sillytavern_data_root(self.data_root)
+        self.multi_user = multi_user
+        self.default_user = os.path.basename(os.path.normpath(os.path.abspath(data_path)))
+        self._users = {self.default_user: _UserData(self.default_user, data_path, index_path)}
+        self._users_lock = threading.Lock()
+        # Already compressed media is stored, everything else deflated
+        self.compression_policy = CompressionPolicy(compress_level)
+        self.compress_workers = compress_workers
+        # Keeps /info counters fresh while the server runs
+        self.refresh_interval = refresh_interval
+        self._refresh_stop = threading.Event()
+        self._refresh_thread = None
+        self._changes_cond = threading.Condition()
+        self._event_listeners = 0
+        # Called after the journal changed or refreshing stopped, e.g. to wake async /events listeners
+        self._change_callbacks = []
+        self._manifest_cache_lock = threading.Lock()
+        # In-progress archive snapshot builds: {etag: Future}, joined by concurrent /zip requests
+        self._archive_builds = {}
+        self._archive_builds_lock = threading.Lock()
+        self.metrics = self._create_metrics()
 
         self._log(f"数据同步服务已初始化", 'info')
         self._log(f"数据路径: {self.data_path}", 'info')
+        self._log(f"可同步用户: {', '.join(self.list_users())}", 'info')
         self._log(f"监听地址: {self.host}:{port}", 'info')
         self._log("注意: 服务器仅在局域网内监听，确保安全性", 'info')
 
@@ -160,6 +240,114 @@ class SyncServer:
         # Setup logging and custom request handler
         self._setup_logging()
         self._setup_routes()
+        self._metric_routes = frozenset(rule.rule for rule in self.app.url_map.iter_rules())
+        self.app.wsgi_app = MetricsMiddleware(self.app.wsgi_app, self.metrics, lambda: self._metric_routes)
+
+    @property
+    def _user(self):
+        """_UserData of the current request"""
+        return self._users[_current_user.get() or self.default_user]
+
+    @property
+    def data_path(self):
+        return self._user.data_path
+
+    @property
+    def index(self):
+        return self._user.index
+
+    @property
+    def _manifest_cache(self):
+        return self._user.manifest_cache
+
+    @property
+    def _tree_cache(self):
+        return self._user.tree_cache
+
+    @_tree_cache.setter
+    def _tree_cache(self, value):
+        self._user.tree_cache = value
+
+    def list_users(self):
+        """
+        Handles of the SillyTavern users under the data root
+
+        Internal directories (``_storage``, ``_uploads``, ...) and directories
+        without a ``settings.json`` are not users and are never served.
+        Without multi-user mode only the default user is served.
+
+        Returns:
+            list: Sorted user handles, always including the default user
+        """
+        users = {self.default_user}
+        if not self.multi_user:
+            return sorted(users)
+        try:
+            for entry in os.scandir(self.data_root):
+                if entry.name.startswith(('_', '.')) or not entry.is_dir():
+                    continue
+                if os.path.isfile(os.path.join(entry.path, 'settings.json')):
+                    users.add(entry.name)
+        except OSError:
+            pass
+        return sorted(users)
+
+    @staticmethod
+    def _is_sillytavern_data_root(path):
+        """Whether ``path`` is the ``data`` directory of a SillyTavern install (next to its server.js)"""
+        return os.path.basename(path) == 'data' and \
+            os.path.isfile(os.path.join(os.path.dirname(path), 'server.js'))
+
+    def select_user(self, handle):
+        """
+        Make ``handle`` the user of the current request, opening its index on first use
+
+        Args:
+            handle (str): User handle, None or empty for the default user
+
+        Returns:
+            str: Error message, or None on success
+        """
+        handle = handle or self.default_user
+        error = self._load_user(handle)
+        if error:
+            return error
+        _current_user.set(handle)
+        return None
+
+    def _load_user(self, handle):
+        """
+        Open the data of ``handle`` unless it is loaded already
+
+        Lists the data root and opens the index database on first use, so
+        async callers run it in an executor.
+
+        Returns:
+            str: Error message, or None on success
+        """
+        if handle not in self._users:
+            if handle not in self.list_users():
+                return f'Unknown user: {handle}'
+            with self._users_lock:
+                if handle not in self._users:
+                    self._log(f"加载用户数据: {handle}", 'info')
+                    self._users[handle] = _UserData(handle, os.path.join(self.data_root, handle))
+        return None
+
+    @contextmanager
+    def _as_user(self, handle):
+        """Work on the data of ``handle`` inside the block"""
+        token = _current_user.set(handle)
+        try:
+            yield self._users[handle]
+        finally:
+            _current_user.reset(token)
+
+    def close_indexes(self):
+        """Close the index databases of all loaded users"""
+        with self._users_lock:
+            for user in self._users.values():
+                user.index.close()
 
     def set_ui_log_callback(self, callback):
         """
@@ -320,26 +508,60 @@ class SyncServer:
     def _setup_routes(self):
         """Setup Flask routes"""
 
+        @self.app.before_request
+        def select_user():
+            """Every route takes ?user=<handle>, the default user when absent"""
+            error = self.select_user(request.args.get('user'))
+            if error:
+                return jsonify({'success': False, 'error': error}), 404
+
+        @self.app.route('/users', methods=['GET'])
+        def get_users():
+            """List the users that can be synced"""
+            return jsonify(self._users_payload())
+
         @self.app.route('/health', methods=['GET'])
         def health_check():
             """Health check endpoint"""
-            return jsonify({
-                'status': 'healthy',
-                'timestamp': datetime.now().isoformat(),
-                'data_path': self.data_path
-            })
+            return jsonify(self._health_payload())
 
         @self.app.route('/manifest', methods=['GET'])
         def get_manifest():
-            """Get file manifest with metadata"""
+            """
+            Get file manifest with metadata, ?hashes=1 adds content hashes
+
+            ?format=ndjson streams a compact line-per-file manifest instead,
+            optionally paged with ?after=<path>&limit=<n>.
+
+            The response carries an ETag derived from the index version, a
+            matching If-None-Match is answered with 304 without serializing.
+            """
             try:
-                manifest = self._generate_manifest()
-                return jsonify({
-                    'success': True,
-                    'manifest': manifest,
-                    'total_files': len(manifest),
-                    'generated_at': datetime.now().isoformat()
-                })
+                with_hash = request.args.get('hashes') in ('1', 'true')
+                ndjson = request.args.get('format') == 'ndjson'
+                self.index.refresh()
+                etag, weak = self._manifest_etag(with_hash, ndjson)
+
+                if request.if_none_match.contains_weak(etag):
+                    response = Response(status=304)
+                    response.set_etag(etag, weak=weak)
+                    return response
+
+                if ndjson:
+                    page, error = self._parse_manifest_page(request.args.get('after'), request.args.get('limit'))
+                    if error:
+                        return jsonify({
+                            'success': False,
+                            'error': error
+                        }), 400
+                    response = Response(
+                        self._iter_manifest_ndjson(with_hash, *page),
+                        mimetype=MANIFEST_NDJSON_MIMETYPE
+                    )
+                else:
+                    response = Response(self._manifest_body(with_hash, etag), mimetype='application/json')
+                response.set_etag(etag, weak=weak)
+                return response
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -348,15 +570,42 @@ class SyncServer:
 
         @self.app.route('/zip', methods=['GET'])
         def get_zip():
-            """Get all data as ZIP file"""
+            """
+            Get all data as ZIP file, ?format=tar|tar.gz|tar.zst selects a tar
+            transport instead (see archive_formats in /health)
+
+            The archive bytes are a pure function of the indexed files, so the
+            index version is a strong ETag. Every request is served from the
+            on-disk snapshot of that version, built once and shared by all
+            devices syncing the same data (with Content-Length and Range).
+            """
             try:
-                zip_buffer = self._create_zip()
-                return send_file(
-                    io.BytesIO(zip_buffer.getvalue()),
-                    mimetype='application/zip',
+                fmt = request.args.get('format', 'zip')
+                if fmt not in self._archive_formats():
+                    return jsonify({
+                        'success': False,
+                        'error': f'Unsupported archive format: {fmt}'
+                    }), 400
+
+                self.index.refresh(full=True)
+                etag = self._archive_etag(fmt)
+                snapshot = self._open_archive_snapshot(etag, fmt)
+                # Sent from the already opened file, a path could be discarded meanwhile
+                response = send_file(
+                    snapshot,
+                    mimetype=self._archive_mimetype(fmt),
                     as_attachment=False,
-                    download_name='sillytavern_data.zip'
+                    download_name=f'sillytavern_data.{fmt}',
+                    conditional=False,
+                    etag=etag
                 )
+                size = os.fstat(snapshot.fileno()).st_size
+                response.content_length = size
+                try:
+                    return response.make_conditional(request, accept_ranges=True, complete_length=size)
+                except Exception:
+                    snapshot.close()
+                    raise
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -374,32 +623,20 @@ class SyncServer:
                 }), 400
 
             try:
-                # Security check - prevent directory traversal
-                base = os.path.realpath(self.data_path)
-                full_path = os.path.realpath(os.path.join(self.data_path, file_path))
-
-                if not full_path.startswith(base + os.sep) and full_path != base:
-                    return jsonify({
-                        'success': False,
-                        'error': 'Access denied'
-                    }), 403
-
-                if not os.path.exists(full_path):
+                full_path, error, status = self._resolve_file(file_path)
+                if error:
                     return jsonify({
                         'success': False,
-                        'error': 'File not found'
-                    }), 404
-
-                if not os.path.isfile(full_path):
-                    return jsonify({
-                        'success': False,
-                        'error': f'Not a file: {file_path}'
-                    }), 400
+                        'error': error
+                    }), status
 
+                # conditional=True handles Range / If-Range against the file ETag
                 return send_file(
                     full_path,
                     as_attachment=False,
-                    download_name=os.path.basename(full_path)
+                    download_name=os.path.basename(full_path),
+                    conditional=True,
+                    etag=True
                 )
 
             except Exception as e:
@@ -408,99 +645,826 @@ class SyncServer:
                     'error': str(e)
                 }), 500
 
+        @self.app.route('/changes', methods=['GET'])
+        def get_changes():
+            """
+            Get files changed since a journal cursor
+
+            Query: since (cursor from a manifest or earlier changes call),
+            journal (journal id the cursor belongs to), hashes=1 for content
+            hashes. ``reset: true`` means the cursor is unusable and the
+            client has to compare the full manifest.
+            """
+            payload, error = self._changes_payload(
+                request.args.get('since'), request.args.get('journal'),
+                request.args.get('hashes') in ('1', 'true')
+            )
+            if error:
+                return jsonify({
+                    'success': False,
+                    'error': error
+                }), 400
+            return jsonify(payload)
+
+        @self.app.route('/events', methods=['GET'])
+        def get_events():
+            """
+            Server-Sent Events stream of change batches
+
+            Query: since and journal like /changes (Last-Event-ID overrides
+            since on reconnect). Each ``changes`` event carries a /changes
+            payload whose cursor is also the event id; ``reset`` means the
+            cursor is unusable and the client has to resync fully.
+            """
+            since = request.headers.get('Last-Event-ID') or request.args.get('since')
+            try:
+                since = int(since)
+            except (TypeError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid since parameter'
+                }), 400
+
+            return Response(
+                self._iter_events(since, request.args.get('journal')),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        @self.app.route('/tree', methods=['GET'])
+        def get_tree():
+            """
+            Get one directory level of the Merkle tree, ?path= defaults to the root
+
+            Subdirectories come with their hashes only, so a client descends
+            just into the ones that differ from its own tree.
+            """
+            payload, error, status = self._tree_payload(request.args.get('path', ''))
+            if error:
+                return jsonify({
+                    'success': False,
+                    'error': error
+                }), status
+            return jsonify(payload)
+
+        @self.app.route('/tail', methods=['GET'])
+        def get_tail():
+            """
+            Get the bytes appended to a file since the client's copy
+
+            Query: path, offset (client file length), prefix_hash (hash of
+            the client's bytes). Answers 412 when the server's first
+            ``offset`` bytes differ, the client then downloads the whole file.
+            """
+            tail, error, status = self._open_tail(
+                request.args.get('path'), request.args.get('offset'), request.args.get('prefix_hash')
+            )
+            if error:
+                return jsonify({
+                    'success': False,
+                    'error': error
+                }), status
+
+            return Response(
+                self._iter_tail(tail),
+                mimetype='application/octet-stream',
+                headers=self._tail_headers(tail)
+            )
+
+        @self.app.route('/files', methods=['POST'])
+        def get_files():
+            """Get many files in one framed response, body: {"paths": [...]}"""
+            paths, error = self._parse_batch_request(request.get_json(silent=True))
+            if error:
+                return jsonify({
+                    'success': False,
+                    'error': error
+                }), 400
+
+            return Response(self._iter_batch_frames(paths), mimetype=FRAMES_MIMETYPE)
+
+        @self.app.route('/delta', methods=['POST'])
+        def get_delta():
+            """
+            Get a file as a delta against the client's copy
+
+            Body: {"path", "size", "block_size", "blocks": [[adler32, strong], ...]}
+            """
+            delta, error = self._parse_delta_request(request.get_json(silent=True))
+            if error:
+                return jsonify({
+                    'success': False,
+                    'error': error[0]
+                }), error[1]
+
+            return Response(iter_delta_frames(*delta), mimetype=FRAMES_MIMETYPE)
+
         @self.app.route('/info', methods=['GET'])
         def get_info():
-            """Get server information"""
-            return jsonify({
+            """Get server information (counters come from the index, no tree walk)"""
+            return jsonify(self._info_payload())
+
+        @self.app.route('/metrics', methods=['GET'])
+        def get_metrics():
+            """Request, cache and build metrics in the Prometheus text format"""
+            return Response(self.metrics.render(), content_type=METRICS_MIMETYPE)
+
+    # Route logic shared by the Flask app and the aiohttp engine
+
+    def _create_metrics(self):
+        """Metrics registry with gauges read from the server state at scrape time"""
+        metrics = SyncMetrics()
+        metrics.gauge('sync_index_files', 'Files in the manifest index',
+                      lambda: self.index.stats()['file_count'])
+        metrics.gauge('sync_index_bytes', 'Total size of the indexed files',
+                      lambda: self.index.stats()['total_size'])
+        metrics.gauge('sync_event_listeners', 'Connected /events streams',
+                      lambda: self._event_listeners)
+        metrics.gauge('sync_archive_builds_in_progress', 'Archive snapshots being built',
+                      lambda: len(self._archive_builds))
+        return metrics
+
+    def _health_payload(self):
+        """Body of /health"""
+        return {
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'data_path': self.data_path,
+            'user': self._user.handle,
+            'archive_formats': self._archive_formats(),
+            # Every ZIP entry is deflated (level 0 for stored files), clients can extract while downloading
+            'zip_streaming': True
+        }
+
+    def _users_payload(self):
+        """Body of /users"""
+        return {
+            'success': True,
+            'users': self.list_users(),
+            'default_user': self.default_user
+        }
+
+    def _archive_formats(self):
+        """Formats /zip can produce, zip first"""
+        return ['zip'] + available_formats()
+
+    def _archive_mimetype(self, fmt):
+        return TAR_MIMETYPES.get(fmt, 'application/zip')
+
+    def _info_payload(self):
+        """Body of /info"""
+        stats = self.index.stats()
+        if stats['updated_at'] is None:
+            # Nothing indexed yet in this process
+            self.index.refresh()
+            stats = self.index.stats()
+
+        return {
+            'success': True,
+            'server_info': {
+                'data_path': self.data_path,
+                'user': self._user.handle,
+                'port': self.port,
+                'host': self.host,
+                'running': self.running,
+                'total_size': stats['total_size'],
+                'file_count': stats['file_count'],
+                'stats_updated_at': stats['updated_at']
+            }
+        }
+
+    def _manifest_body(self, with_hash, etag):
+        """
+        Serialized /manifest body for the version tagged ``etag``
+
+        The last body per variant is reused while the index version is unchanged.
+        """
+        with self._manifest_cache_lock:
+            cached = self._manifest_cache.get(with_hash)
+        if cached and cached[0] == etag:
+            self.metrics.cache_lookups.inc(cache='manifest', result='hit')
+            return cached[1]
+
+        self.metrics.cache_lookups.inc(cache='manifest', result='miss')
+        with self.metrics.manifest_generation.time(variant='json-hash' if with_hash else 'json'):
+            cursor = self.index.journal_cursor()
+            manifest = self._generate_manifest(with_hash=with_hash)
+            body = json.dumps({
                 'success': True,
-                'server_info': {
-                    'data_path': self.data_path,
-                    'port': self.port,
-                    'host': self.host,
-                    'running': self.running,
-                    'total_size': self._calculate_total_size(),
-                    'file_count': len(self._generate_manifest())
-                }
-            })
-
-    def _generate_manifest(self):
-        """Generate file manifest with metadata"""
-        manifest = []
-
-        for root, dirs, files in os.walk(self.data_path):
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-
-            for file in files:
-                # Skip hidden files and temporary files
-                if file.startswith('.') or file.endswith('.tmp'):
-                    continue
+                'manifest': manifest,
+                'total_files': len(manifest),
+                'hash_algorithm': HASH_ALGORITHM,
+                'version': self.index.version,
+                'journal_id': self.index.journal_id,
+                'cursor': cursor,
+                'generated_at': datetime.now().isoformat()
+            }, ensure_ascii=False)
+        # A change racing with generation only makes the body newer than its tag
+        with self._manifest_cache_lock:
+            self._manifest_cache[with_hash] = (etag, body)
+        return body
+
+    def _changes_payload(self, since, journal_id, with_hash):
+        """
+        Body of /changes
+
+        Returns:
+            tuple: (payload, error), error is None when the request is valid
+        """
+        try:
+            since = int(since)
+        except (TypeError, ValueError):
+            return None, 'Invalid since parameter'
+
+        self.index.refresh()
+        cursor = self.index.journal_cursor()
+        payload = {
+            'success': True,
+            'journal_id': self.index.journal_id,
+            'cursor': cursor,
+            'hash_algorithm': HASH_ALGORITHM
+        }
+
+        changes = self.index.changes(since) if journal_id == self.index.journal_id else None
+        if changes is None:
+            payload['reset'] = True
+            return payload, None
+
+        if with_hash:
+            pending = [item for item in changes if item['op'] != 'delete' and 'hash' not in item]
+            if pending:
+                self.index.ensure_hashes([item['path'] for item in pending])
+                for item in pending:
+                    entry = self.index.get(item['path'])
+                    if entry is not None and entry.hash:
+                        item['hash'] = entry.hash
+
+        payload['reset'] = False
+        payload['changes'] = changes
+        return payload, None
+
+    def _iter_events(self, since, journal_id):
+        """
+        Body of /events
 
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, self.data_path)
+        Waits on the change condition that the background refresh signals,
+        so a change reaches listeners within about EVENTS_REFRESH_INTERVAL.
+        """
+        with self._changes_cond:
+            self._event_listeners += 1
+        try:
+            yield 'retry: 3000\n\n'
+            cursor = since
+            while not self._refresh_stop.is_set():
+                payload, _ = self._changes_payload(cursor, journal_id, True)
+                if payload['reset']:
+                    yield self._format_event('reset', payload, payload['cursor'])
+                    return
 
-                try:
-                    stat_info = os.stat(file_path)
-                    manifest.append({
-                        'path': relative_path.replace('\\', '/'),  # Normalize to forward slashes
-                        'size': stat_info.st_size,
-                        'mtime': stat_info.st_mtime,
-                        'modified': datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
-                        'is_dir': False
-                    })
-                except OSError:
-                    # Skip files that can't be accessed
+                if payload['changes']:
+                    cursor = payload['cursor']
+                    yield self._format_event('changes', payload, cursor)
                     continue
 
-        return manifest
+                with self._changes_cond:
+                    changed = self._changes_cond.wait_for(
+                        lambda: self.index.journal_cursor() != cursor or self._refresh_stop.is_set(),
+                        timeout=self.EVENTS_KEEPALIVE
+                    )
+                if not changed:
+                    yield ': keepalive\n\n'
+        finally:
+            with self._changes_cond:
+                self._event_listeners -= 1
+
+    def _format_event(self, event, payload, event_id):
+        """Encode one Server-Sent Event"""
+        return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def _tree_payload(self, rel_dir):
+        """
+        Body of /tree
+
+        Returns:
+            tuple: (payload, error, http_status), error is None on success
+        """
+        rel_dir = rel_dir.strip('/')
+        version, cursor, tree = self._merkle_tree()
+        node = tree.node(rel_dir)
+        if node is None:
+            return None, f'Directory not found: {rel_dir}', 404
+
+        node.update({
+            'success': True,
+            'hash_algorithm': HASH_ALGORITHM,
+            'version': version,
+            'journal_id': self.index.journal_id,
+            'cursor': cursor
+        })
+        return node, None, 200
+
+    def _merkle_tree(self):
+        """
+        Merkle tree of the current index, rebuilt only when the index version changes
+
+        Returns:
+            tuple: (index version, journal cursor, MerkleTree)
+        """
+        self.index.refresh()
+        version = self.index.version
+        with self._manifest_cache_lock:
+            cached = self._tree_cache
+        if cached and cached[0] == version:
+            self.metrics.cache_lookups.inc(cache='tree', result='hit')
+            return cached
+
+        self.metrics.cache_lookups.inc(cache='tree', result='miss')
+        with self.metrics.manifest_generation.time(variant='tree'):
+            self.index.ensure_hashes()
+            cursor = self.index.journal_cursor()
+            cached = (version, cursor, MerkleTree(self.index.entries()))
+        with self._manifest_cache_lock:
+            self._tree_cache = cached
+        return cached
+
+    def _parse_manifest_page(self, after, limit):
+        """
+        Validate the paging parameters of the NDJSON manifest
+
+        Returns:
+            tuple: ((after, limit), error), error is None when valid
+        """
+        if limit is None:
+            return (after, None), None
+        try:
+            limit = int(limit)
+        except ValueError:
+            return None, 'Invalid limit'
+        if limit <= 0:
+            return None, 'Invalid limit'
+        return (after, limit), None
+
+    def _iter_manifest_ndjson(self, with_hash, after=None, limit=None, lines_per_chunk=1000):
+        """
+        Stream the manifest as NDJSON
+
+        A header object is followed by one ``[path, size, mtime(, hash)]`` array
+        per file in path order and a trailer ``{"done": true, "count": n}``.
+        The trailer of a truncated page carries ``next``, the cursor for
+        ``after`` on the following request.
+
+        Args:
+            with_hash (bool): Include content hashes
+            after (str): Only list paths sorting after this one
+            limit (int): Maximum number of files in this page
+        """
+        # Rows are serialized while streaming, only the snapshot is timed
+        with self.metrics.manifest_generation.time(variant='ndjson-hash' if with_hash else 'ndjson'):
+            if with_hash:
+                self.index.ensure_hashes()
+            # Read before the snapshot, a change in between is only reported twice
+            cursor = self.index.journal_cursor()
+            entries = self.index.entries()
+
+        # Binary search for the page start, entries are sorted by path
+        start, end = 0, len(entries)
+        if after is not None:
+            while start < end:
+                middle = (start + end) // 2
+                if entries[middle].path <= after:
+                    start = middle + 1
+                else:
+                    end = middle
+        stop = len(entries) if limit is None else min(len(entries), start + limit)
+
+        fields = ['path', 'size', 'mtime'] + (['hash'] if with_hash else [])
+        yield json.dumps({
+            'fields': fields,
+            'total_files': len(entries),
+            'hash_algorithm': HASH_ALGORITHM,
+            'version': self.index.version,
+            'journal_id': self.index.journal_id,
+            'cursor': cursor
+        }, ensure_ascii=False) + '\n'
+
+        for chunk_start in range(start, stop, lines_per_chunk):
+            lines = []
+            for entry in entries[chunk_start:min(stop, chunk_start + lines_per_chunk)]:
+                row = [entry.path, entry.size, entry.mtime]
+                if with_hash:
+                    row.append(entry.hash)
+                lines.append(json.dumps(row, ensure_ascii=False, separators=(',', ':')))
+            yield '\n'.join(lines) + '\n'
+
+        trailer = {'done': True, 'count': stop - start}
+        if stop < len(entries):
+            trailer['next'] = entries[stop - 1].path
+        yield json.dumps(trailer, ensure_ascii=False) + '\n'
+
+    def _parse_batch_request(self, data):
+        """
+        Validate a POST /files body
+
+        Returns:
+            tuple: (paths, error), error is None when the request is valid
+        """
+        paths = (data or {}).get('paths') if isinstance(data, dict) else None
+        if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+            return None, 'Missing paths list'
+
+        if len(paths) > self.MAX_BATCH_FILES:
+            return None, f'Too many paths (max {self.MAX_BATCH_FILES})'
+
+        return paths, None
+
+    def _parse_delta_request(self, data):
+        """
+        Validate a POST /delta body
+
+        Returns:
+            tuple: ((full_path, signature, block_size, basis_size), None) or
+            (None, (error, http_status))
+        """
+        if not isinstance(data, dict) or not isinstance(data.get('path'), str):
+            return None, ('Missing path', 400)
+
+        block_size, basis_size, blocks = data.get('block_size'), data.get('size'), data.get('blocks')
+        if not isinstance(block_size, int) or not BLOCK_SIZE_MIN <= block_size <= BLOCK_SIZE_MAX:
+            return None, (f'block_size must be between {BLOCK_SIZE_MIN} and {BLOCK_SIZE_MAX}', 400)
+        if not isinstance(basis_size, int) or not isinstance(blocks, list) or \
+                len(blocks) != -(-basis_size // block_size):
+            return None, ('Invalid size or blocks', 400)
+        try:
+            signature = [(int(weak), str(strong)) for weak, strong in blocks]
+        except (TypeError, ValueError):
+            return None, ('Invalid blocks', 400)
+
+        full_path, error, status = self._resolve_file(data['path'])
+        if error:
+            return None, (error, status)
+
+        return (full_path, signature, block_size, basis_size), None
+
+    def _iter_batch_frames(self, paths):
+        """Framed response body of POST /files"""
+        def resolve_all():
+            for file_path in paths:
+                full_path, error, _ = self._resolve_file(file_path)
+                yield file_path, full_path, error
+
+        return iter_file_frames(resolve_all())
+
+    def _open_tail(self, file_path, offset, prefix_hash):
+        """
+        Validate a /tail request against the current file content
+
+        The file is opened once, so the prefix check and the streamed tail
+        see the same file even if it is appended to meanwhile.
+
+        Returns:
+            tuple: (tail, error, http_status), tail is a dict with the open
+            file positioned at ``offset`` and the byte count to send
+        """
+        if not file_path or offset is None or not prefix_hash:
+            return None, 'Missing path, offset or prefix_hash parameter', 400
+        try:
+            offset = int(offset)
+        except ValueError:
+            return None, 'Invalid offset', 400
+        if offset < 0:
+            return None, 'Invalid offset', 400
+
+        full_path, error, status = self._resolve_file(file_path)
+        if error:
+            return None, error, status
+
+        f = open(full_path, 'rb')
+        try:
+            stat_info = os.fstat(f.fileno())
+            if stat_info.st_size < offset or hash_stream(f, offset) != prefix_hash:
+                f.close()
+                return None, 'Prefix mismatch', 412
+        except Exception:
+            f.close()
+            raise
+
+        return {
+            'file': f,
+            'offset': offset,
+            'length': stat_info.st_size - offset,
+            'size': stat_info.st_size,
+            'mtime': stat_info.st_mtime
+        }, None, 200
+
+    def _tail_headers(self, tail):
+        """Response headers describing a /tail body"""
+        return {
+            'Content-Length': str(tail['length']),
+            'X-Sync-Offset': str(tail['offset']),
+            'X-Sync-Size': str(tail['size']),
+            'X-Sync-Mtime': repr(tail['mtime'])
+        }
+
+    def _iter_tail(self, tail, chunk_size=64 * 1024):
+        """Stream the tail of an opened /tail file, then close it"""
+        with tail['file'] as f:
+            remaining = tail['length']
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    raise IOError(f"文件在传输过程中被修改: {f.name}")
+                remaining -= len(data)
+                yield data
+
+    def _resolve_file(self, file_path):
+        """
+        Resolve a client supplied relative path inside the data directory
+
+        Args:
+            file_path (str): Relative path from the request
+
+        Returns:
+            tuple: (full_path, error, http_status), error is None on success
+        """
+        # Security check - prevent directory traversal
+        base = os.path.realpath(self.data_path)
+        full_path = os.path.realpath(os.path.join(self.data_path, file_path))
+
+        if not full_path.startswith(base + os.sep) and full_path != base:
+            return None, 'Access denied', 403
+
+        if not os.path.exists(full_path):
+            return None, 'File not found', 404
+
+        if not os.path.isfile(full_path):
+            return None, f'Not a file: {file_path}', 400
+
+        return full_path, None, 200
+
+    def _generate_manifest(self, with_hash=False):
+        """
+        Generate file manifest with metadata from the persistent index
+
+        Args:
+            with_hash (bool): Include content hashes (computed once, then cached)
+        """
+        return self.index.manifest(with_hash=with_hash)
 
     def _create_zip(self):
-        """Create ZIP file of all data"""
-        zip_buffer = io.BytesIO()
+        """
+        Create a streaming ZIP archive of all indexed files, in path order
+
+        Returns:
+            ParallelZipStream: Iterable yielding archive chunks as files are compressed
+        """
+        files = ((os.path.join(self.data_path, entry.path), entry.path) for entry in self.index.entries())
+        return ParallelZipStream(files, policy=self.compression_policy, on_finish=self._log_compression_stats,
+                                 workers=self.compress_workers)
+
+    def _create_archive(self, fmt='zip'):
+        """
+        Create a streaming archive of all indexed files in the given transport format
+
+        Returns:
+            Iterable yielding archive chunks
+        """
+        if fmt == 'zip':
+            return self._create_zip()
+        files = ((os.path.join(self.data_path, entry.path), entry.path) for entry in self.index.entries())
+        return TarStream(files, fmt, level=self.compression_policy.level or 1,
+                         on_finish=self._log_compression_stats)
+
+    def _log_compression_stats(self, stats):
+        """Report per-category compression ratios of a finished archive"""
+        self._log(f"归档打包完成 (压缩级别 {self.compression_policy.level})，压缩情况:", 'info')
+        for line in stats.summary_lines():
+            self._log(f"  {line}", 'info')
+
+    def _manifest_etag(self, with_hash, ndjson=False):
+        """
+        Validator of the /manifest representation
+
+        With hashes every entry is fully determined by the index version, so the
+        ETag is strong. Without, cached hashes may or may not be included, so a
+        weak ETag is used.
+
+        Args:
+            with_hash (bool): Manifest includes content hashes
+            ndjson (bool): NDJSON representation instead of the JSON document
+
+        Returns:
+            tuple: (etag, weak)
+        """
+        kind = 'n' if ndjson else 'm'
+        if with_hash:
+            return f"{self.index.version}-{kind}h", False
+        return f"{self.index.version}-{kind}", True
+
+    def _archive_etag(self, fmt='zip'):
+        """Strong validator of the archive /zip currently produces in ``fmt``"""
+        if fmt == 'zip':
+            return f"{self.index.version}-{self.ARCHIVE_FORMAT}-{self.compression_policy.tag}"
+        return f"{self.index.version}-{self.TAR_ARCHIVE_FORMAT}{fmt[3:]}-{self.compression_policy.tag}"
+
+    def _archive_snapshot_prefix(self):
+        key = hashlib.sha1(os.path.realpath(self.data_path).encode('utf-8')).hexdigest()[:16]
+        return f"archive_{key}_"
+
+    def _archive_snapshot_path(self, etag, fmt='zip'):
+        return os.path.join(get_cache_dir(), f"{self._archive_snapshot_prefix()}{etag}.{fmt}")
+
+    def _open_archive_snapshot(self, etag, fmt='zip'):
+        """
+        Open the archive for ``etag`` from the sync cache, writing it first if needed
+
+        The snapshot is reused while the data is unchanged. Only one build
+        per ETag runs at a time, concurrent callers wait for it and share the
+        result.
+
+        Returns:
+            file: Snapshot opened for binary reading
+        """
+        first = True
+        while True:
+            snapshot, build, owner = self._claim_archive_snapshot(etag, fmt, count_lookup=first)
+            if snapshot is not None:
+                return snapshot
+            if owner:
+                self._run_archive_build(etag, fmt, build)
+            else:
+                build.result()
+            first = False
+
+    def _claim_archive_snapshot(self, etag, fmt='zip', count_lookup=True):
+        """
+        Open the snapshot for ``etag``, or look up the build that produces it
+
+        The file is opened under the lock _discard_archive_snapshots() deletes
+        under, so a newer version finishing meanwhile can't remove it before
+        it is sent. Doesn't wait for builds, so async callers can wait for
+        another request's build on their event loop; once a build is done,
+        claim again to open its result.
+
+        Args:
+            count_lookup (bool): Record the lookup in the cache metrics (not for the claim after a build)
 
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for root, dirs, files in os.walk(self.data_path):
-                # Skip hidden directories
-                dirs[:] = [d for d in dirs if not d.startswith('.')]
+        Returns:
+            tuple: (snapshot file or None, build Future or None, True if the
+            caller registered the build and must run it with _run_archive_build())
+        """
+        snapshot_path = self._archive_snapshot_path(etag, fmt)
+        with self._archive_builds_lock:
+            try:
+                snapshot = open(snapshot_path, 'rb')
+            except FileNotFoundError:
+                build = self._archive_builds.get(etag)
+                owner = build is None
+                if owner:
+                    build = self._archive_builds[etag] = Future()
+            else:
+                if count_lookup:
+                    self.metrics.cache_lookups.inc(cache='archive', result='hit')
+                return snapshot, None, False
+
+        if count_lookup:
+            self.metrics.cache_lookups.inc(cache='archive', result='miss' if owner else 'wait')
+        if not owner:
+            self._log(f"{fmt} 快照正在生成，等待完成...", 'info')
+        return None, build, owner
+
+    def _run_archive_build(self, etag, fmt, build):
+        """
+        Build the snapshot registered by _claim_archive_snapshot() and resolve its Future
 
-                for file in files:
-                    # Skip hidden files and temporary files
-                    if file.startswith('.') or file.endswith('.tmp'):
-                        continue
+        Returns:
+            str: Snapshot file path
+        """
+        cache_dir = get_cache_dir()
+        prefix = self._archive_snapshot_prefix()
+        snapshot_path = self._archive_snapshot_path(etag, fmt)
 
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, self.data_path)
+        self._log(f"正在生成 {fmt} 快照...", 'info')
+        fd, temp_path = tempfile.mkstemp(prefix=prefix, suffix='.tmp', dir=cache_dir)
+        try:
+            with self.metrics.archive_build.time(format=fmt), os.fdopen(fd, 'wb') as f:
+                for chunk in self._create_archive(fmt):
+                    f.write(chunk)
+            os.replace(temp_path, snapshot_path)
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            build.set_exception(e)
+            raise
+        else:
+            build.set_result(snapshot_path)
+        finally:
+            with self._archive_builds_lock:
+                self._archive_builds.pop(etag, None)
+
+        # Snapshots of older data versions are no longer useful
+        self._discard_archive_snapshots(keep_version=etag.split('-', 1)[0])
+        return snapshot_path
+
+    def _discard_archive_snapshots(self, keep_version=None):
+        """
+        Delete cached archive snapshots
 
+        Args:
+            keep_version (str): Keep the snapshots (all formats) of this index version
+        """
+        cache_dir = get_cache_dir()
+        prefix = self._archive_snapshot_prefix()
+        keep = f"{prefix}{keep_version}-" if keep_version else None
+        # Snapshots are opened under this lock, so a download that found one can always send it
+        with self._archive_builds_lock:
+            for name in os.listdir(cache_dir):
+                path = os.path.join(cache_dir, name)
+                if name.startswith(prefix) and not name.endswith('.tmp') and not (keep and name.startswith(keep)):
                     try:
-                        zip_file.write(file_path, relative_path)
+                        os.unlink(path)
                     except OSError:
-                        # Skip files that can't be accessed
-                        continue
-
-        zip_buffer.seek(0)
-        return zip_buffer
-
-    def _calculate_total_size(self):
-        """Calculate total size of data directory"""
-        total_size = 0
-        for root, dirs, files in os.walk(self.data_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                try:
-                    total_size += os.path.getsize(file_path)
-                except OSError:
-                    continue
-        return total_size
+                        # Still being sent on Windows, removed with the next change
+                        pass
+
+    def start_background_refresh(self):
+        """Start the thread that keeps the index (and /info counters) up to date"""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+
+        def refresh_loop():
+            # Only users that have been requested are kept fresh
+            seen = {
+                user.handle: (user.index.journal_cursor(), user.index.version)
+                for user in list(self._users.values())
+            }
+            while not self._refresh_stop.is_set():
+                changed = False
+                for handle in list(self._users):
+                    with self._as_user(handle):
+                        try:
+                            with self.metrics.index_refresh.time():
+                                self.index.refresh()
+                        except Exception as e:
+                            self._log(f"刷新文件索引失败 ({handle}): {e}", 'warning')
+
+                        cursor, version = self.index.journal_cursor(), self.index.version
+                        previous = seen.get(handle, (cursor, version))
+                        seen[handle] = (cursor, version)
+                        changed = changed or cursor != previous[0]
+                        if version != previous[1]:
+                            # Cached archives of older data versions are no longer useful
+                            self._discard_archive_snapshots(keep_version=version)
+
+                if changed:
+                    self._signal_changes()
+                with self._changes_cond:
+                    listening = self._event_listeners > 0
+
+                self._refresh_stop.wait(self.EVENTS_REFRESH_INTERVAL if listening else self.refresh_interval)
+
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(target=refresh_loop, daemon=True)
+        self._refresh_thread.start()
+
+    def _signal_changes(self):
+        """Wake the /events listeners to read the journal again"""
+        with self._changes_cond:
+            self._changes_cond.notify_all()
+            callbacks = list(self._change_callbacks)
+        for callback in callbacks:
+            callback()
+
+    def stop_background_refresh(self):
+        """Stop the background index refresh thread (also ends /events streams)"""
+        self._refresh_stop.set()
+        self._signal_changes()
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            self._refresh_thread.join(timeout=5.0)
+        self._refresh_thread = None
+
+    def start(self, block=False, engine='flask'):
+        """
+        Start the sync server
 
-    def start(self, block=False):
-        """Start the sync server"""
+        Args:
+            block (bool): Serve in the calling thread
+            engine (str): 'flask' (werkzeug) or 'aiohttp'
+        """
         if self.running:
             self._log("数据同步服务已在运行", 'warning')
             return
 
+        self.start_background_refresh()
+
         def run_server():
             self._log(f"启动数据同步服务...", 'info')
 
+            if engine == 'aiohttp':
+                from features.sync.aio_server import AioSyncEngine
+                self.httpd = AioSyncEngine(self)
+                self.httpd.serve_forever()
+                return
+
             # Configure Flask to show access logs
             import logging
             werkzeug_logger = logging.getLogger('werkzeug')
@@ -508,7 +1472,9 @@ class SyncServer:
 
             # Start Flask server with custom request handler for better access logging
             from werkzeug.serving import make_server
-            self.httpd = make_server(self.host, self.port, self.app, request_handler=CustomRequestHandler)
+            # Threaded: /events streams stay open for as long as a client follows
+            self.httpd = make_server(self.host, self.port, self.app, threaded=True,
+                                     request_handler=CustomRequestHandler)
             self.httpd.serve_forever()
 
         if block:
@@ -522,9 +1488,12 @@ class SyncServer:
             self._log("可用接口:", 'info')
             self._log("  GET /health      - 健康检查", 'info')
             self._log("  GET /manifest    - 获取文件清单", 'info')
-            self._log("  GET /zip         - 下载所有数据(ZIP)", 'info')
+            self._log("  GET /zip         - 下载所有数据(ZIP，?format= 可选 tar)", 'info')
             self._log("  GET /file?path=  - 下载指定文件", 'info')
+            self._log("  POST /files      - 批量下载文件", 'info')
             self._log("  GET /info        - 服务器信息", 'info')
+            self._log("  GET /users       - 可同步用户列表 (各接口用 ?user= 选择用户)", 'info')
+            self._log("  GET /metrics     - 运行指标 (Prometheus)", 'info')
 
     def stop(self):
         """Stop the sync server"""
@@ -540,6 +1509,9 @@ class SyncServer:
                     if self.server_thread.is_alive():
                         self.server_thread.join(timeout=5.0)
 
+            self.stop_background_refresh()
+            self.close_indexes()
+
             self._log("数据同步服务已停止", 'info')
 
 
@@ -554,14 +1526,24 @@ def main():
                        help='服务器端口 (默认: 9999)')
     parser.add_argument('--host', default=None,
                        help='服务器主机地址 (默认: 自动检测局域网IP)')
+    parser.add_argument('--compress-level', type=int, default=6,
+                       help='ZIP 压缩级别 0-9 (默认: 6, 0 表示不压缩)')
+    parser.add_argument('--compress-workers', type=int, default=None,
+                       help='ZIP 并行压缩线程数 (默认: CPU 核心数)')
+    parser.add_argument('--engine', choices=['flask', 'aiohttp'], default='flask',
+                       help='服务器引擎 (默认: flask)')
     parser.add_argument('--block', action='store_true',
                        help='阻塞运行 (默认后台运行)')
+    parser.add_argument('--multi-user', action=argparse.BooleanOptionalAction, default=None,
+                       help='同时提供同级目录中的其他用户 (默认: 仅当数据目录位于 SillyTavern 的 data 目录下时)')
 
     args = parser.parse_args()
 
     try:
-        server = SyncServer(data_path=args.data_path, port=args.port, host=args.host)
-        server.start(block=args.block)
+        server = SyncServer(data_path=args.data_path, port=args.port, host=args.host,
+                            compress_level=args.compress_level, compress_workers=args.compress_workers,
+                            multi_user=args.multi_user)
+        server.start(block=args.block, engine=args.engine)
 
         if not args.block:
             print("按 Ctrl+C 停止服务...")
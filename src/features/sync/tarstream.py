@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync TAR Stream
+Streaming tar writer/reader for the tar, tar.gz and tar.zst archive transports
+
+Unlike ZIP, a tar stream has no central directory at the end, so the client
+can extract each member as soon as it has been received.
+"""
+
+import os
+import zlib
+import tarfile
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from features.sync.compression import CompressionStats
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+TAR_FORMATS = ('tar', 'tar.gz', 'tar.zst')
+TAR_MIMETYPES = {
+    'tar': 'application/x-tar',
+    'tar.gz': 'application/gzip',
+    'tar.zst': 'application/zstd',
+}
+# Low zstd levels compress faster than gigabit Ethernet delivers
+ZSTD_LEVEL = 3
+
+_BLOCK_SIZE = tarfile.BLOCKSIZE
+_RECORD_SIZE = tarfile.RECORDSIZE
+
+
+def available_formats() -> List[str]:
+    """Tar transports usable in this process (tar.zst needs the zstandard package)"""
+    return [fmt for fmt in TAR_FORMATS if fmt != 'tar.zst' or zstandard is not None]
+
+
+def _compressor(fmt: str, level: int):
+    if fmt == 'tar.gz':
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if fmt == 'tar.zst':
+        # threads=-1 spreads compression over all cores
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).compressobj()
+    return None
+
+
+class TarStream:
+    """
+    Iterable tar archive built on the fly
+
+    Entries are regular files with owner and permissions normalized, so the
+    output only depends on names, contents and modification times. Memory
+    usage is bounded by ``chunk_size`` regardless of file sizes.
+    """
+
+    def __init__(self, files: Iterable[Tuple[str, str]], fmt: str = 'tar', level: int = 6,
+                 chunk_size: int = 64 * 1024,
+                 on_finish: Optional[Callable[[CompressionStats], None]] = None):
+        """
+        Initialize tar stream
+
+        Args:
+            files: Iterable of (full_path, arcname) tuples
+            fmt: One of TAR_FORMATS
+            level: gzip level for tar.gz
+            chunk_size: Read size and approximate size of yielded chunks
+            on_finish: Called with the compression stats once the archive is complete
+        """
+        if fmt not in available_formats():
+            raise ValueError(f"不支持的归档格式: {fmt}")
+        self.files = files
+        self.fmt = fmt
+        self.level = level
+        self.chunk_size = chunk_size
+        self.on_finish = on_finish
+        self.stats = CompressionStats()
+
+    def _iter_raw(self) -> Iterator[bytes]:
+        """
+        Uncompressed tar bytes, counts are left in raw_size / file_count
+
+        Raises:
+            IOError: A file changed while it was read
+        """
+        self.raw_size = self.file_count = 0
+        for full_path, arcname in self.files:
+            try:
+                src = open(full_path, 'rb')
+            except OSError:
+                # Skip files that can't be accessed
+                continue
+
+            with src:
+                stat_info = os.fstat(src.fileno())
+                info = tarfile.TarInfo(arcname)
+                info.size = stat_info.st_size
+                info.mtime = stat_info.st_mtime
+                info.mode = stat_info.st_mode & 0o777
+                header = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+                self.raw_size += len(header)
+                yield header
+
+                # The header fixes the size, a file that changed meanwhile fails the
+                # archive instead of ending up cut or zero padded in it
+                remaining = info.size
+                while remaining > 0:
+                    data = src.read(min(self.chunk_size, remaining))
+                    if not data:
+                        raise IOError(f"文件在打包过程中被修改: {arcname}")
+                    remaining -= len(data)
+                    yield data
+                after = os.fstat(src.fileno())
+                if (after.st_size, after.st_mtime_ns) != (stat_info.st_size, stat_info.st_mtime_ns):
+                    raise IOError(f"文件在打包过程中被修改: {arcname}")
+
+            padding = b'\0' * (-info.size % _BLOCK_SIZE)
+            self.raw_size += info.size + len(padding)
+            self.file_count += 1
+            yield padding
+
+        # End of archive marker, padded to a full record
+        end = 2 * _BLOCK_SIZE
+        end += -(self.raw_size + end) % _RECORD_SIZE
+        self.raw_size += end
+        yield b'\0' * end
+
+    def __iter__(self) -> Iterator[bytes]:
+        compressor = _compressor(self.fmt, self.level)
+        written = 0
+        pending = []
+        pending_size = 0
+
+        for data in self._iter_raw():
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+            if pending_size >= self.chunk_size:
+                written += pending_size
+                yield b''.join(pending)
+                pending, pending_size = [], 0
+
+        if compressor is not None:
+            pending.append(compressor.flush())
+            pending_size += len(pending[-1])
+        if pending_size:
+            written += pending_size
+            yield b''.join(pending)
+
+        self.stats.categories[self.fmt] = {
+            'files': self.file_count, 'raw': self.raw_size, 'compressed': written
+        }
+        if self.on_finish:
+            self.on_finish(self.stats)
+
+
+def open_tar_stream(stream, fmt: str) -> tarfile.TarFile:
+    """
+    Open a tar transport for sequential reading
+
+    Args:
+        stream: Readable binary stream (e.g. the raw HTTP response)
+        fmt: One of TAR_FORMATS
+
+    Returns:
+        TarFile: Archive in stream mode, members must be read in order
+    """
+    if fmt == 'tar.zst':
+        if zstandard is None:
+            raise ValueError("未安装 zstandard，无法解压 tar.zst")
+        return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(stream), mode='r|')
+    if fmt == 'tar.gz':
+        return tarfile.open(fileobj=stream, mode='r|gz')
+    if fmt == 'tar':
+        return tarfile.open(fileobj=stream, mode='r|')
+    raise ValueError(f"不支持的归档格式: {fmt}")
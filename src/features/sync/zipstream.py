@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+SillyTavern Data Sync ZIP Stream
+Streaming ZIP writers that yield archive bytes while files are being compressed,
+and a reader that extracts such archives while they download
+"""
+
+import os
+import struct
+import time
+import zlib
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from features.sync.compression import PROBE_SIZE, CompressionPolicy, CompressionStats
+
+
+# Files are deflated in independent chunks of this size by ParallelZipStream
+PARALLEL_CHUNK_SIZE = 1024 * 1024
+# Deflate window; each chunk after the first is primed with the preceding bytes
+DEFLATE_WINDOW = 32 * 1024
+
+
+class _ChunkSink:
+    """Write-only, unseekable sink that collects the bytes produced by zipfile"""
+
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes not yet drained"""
+        return self._size
+
+    def drain(self) -> bytes:
+        """Return and clear all buffered bytes"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        return data
+
+
+class ZipStream:
+    """
+    Iterable ZIP archive built on the fly
+
+    The sink has no ``seek``/``tell``, so zipfile writes data descriptors after
+    each entry instead of patching local headers. Memory usage is bounded by
+    ``chunk_size`` regardless of archive size, and the first bytes are available
+    as soon as the first entry starts compressing.
+
+    Each entry is deflated at the policy level, or at level 0 for files the
+    policy stores: level 0 writes stored deflate blocks (5 bytes overhead per
+    64 KB), but the deflate stream marks its own end, so every entry can be
+    delimited without the central directory and iter_zip_stream() can extract
+    the archive while it downloads. Per-category sizes are collected in
+    ``stats`` and passed to ``on_finish`` at the end.
+    """
+
+    def __init__(self, files: Iterable[Tuple[str, str]], chunk_size: int = 64 * 1024,
+                 policy: Optional[CompressionPolicy] = None,
+                 on_finish: Optional[Callable[[CompressionStats], None]] = None):
+        """
+        Initialize ZIP stream
+
+        Args:
+            files: Iterable of (full_path, arcname) tuples
+            chunk_size: Read size and approximate size of yielded chunks
+            policy: Per-file compression policy (default: deflate level 6)
+            on_finish: Called with the compression stats once the archive is complete
+        """
+        self.files = files
+        self.chunk_size = chunk_size
+        self.policy = policy or CompressionPolicy()
+        self.on_finish = on_finish
+        self.stats = CompressionStats()
+
+    def __iter__(self) -> Iterator[bytes]:
+        sink = _ChunkSink()
+
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for full_path, arcname in self.files:
+                try:
+                    zinfo = zipfile.ZipInfo.from_file(full_path, arcname)
+                    src = open(full_path, 'rb')
+                except OSError:
+                    # Skip files that can't be accessed
+                    continue
+
+                with src:
+                    data = src.read(max(PROBE_SIZE, self.chunk_size))
+                    category, deflate = self.policy.choose(arcname, data[:PROBE_SIZE])
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    zinfo._compresslevel = self.policy.level if deflate else 0
+
+                    with zip_file.open(zinfo, 'w') as dest:
+                        while data:
+                            dest.write(data)
+                            if sink.pending >= self.chunk_size:
+                                yield sink.drain()
+                            data = src.read(self.chunk_size)
+
+                self.stats.add(category, zinfo.file_size, zinfo.compress_size)
+                if sink.pending:
+                    yield sink.drain()
+
+        # Central directory is written when the archive is closed
+        if sink.pending:
+            yield sink.drain()
+
+        if self.on_finish:
+            self.on_finish(self.stats)
+
+
+class _Precompressed:
+    """Stands in for the zlib compressor of a zipfile entry and emits already deflated data"""
+
+    def __init__(self):
+        self.data = b''
+
+    def compress(self, _raw):
+        data, self.data = self.data, b''
+        return data
+
+    def flush(self):
+        return b''
+
+
+def _deflate(raw: bytes, level: int, zdict: bytes, final: bool) -> bytes:
+    """Raw deflate one chunk, ending it on a byte boundary unless it is the last"""
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _read_chunk(full_path: str, offset: int, length: int, level: int, final: bool):
+    """
+    Read one chunk of a file and deflate it, run on the worker pool
+
+    Returns:
+        tuple: (raw bytes, zdict used, deflated bytes)
+    """
+    with open(full_path, 'rb') as f:
+        start = max(0, offset - DEFLATE_WINDOW) if level else offset
+        f.seek(start)
+        zdict = f.read(offset - start)
+        raw = f.read(length)
+    return raw, zdict, _deflate(raw, level, zdict, final)
+
+
+class ParallelZipStream(ZipStream):
+    """
+    ZIP archive built on the fly with compression spread over a thread pool
+
+    Files are split into PARALLEL_CHUNK_SIZE chunks that workers read and
+    deflate independently (zlib releases the GIL). Every chunk is primed with
+    the 32 KB before it and all but the last end with a sync flush, so the
+    chunks concatenate into one valid deflate stream per entry, as in pigz.
+    Entries are written in input order and the output only depends on the
+    file contents, not on the worker count or scheduling.
+    """
+
+    def __init__(self, files: Iterable[Tuple[str, str]], chunk_size: int = 64 * 1024,
+                 policy: Optional[CompressionPolicy] = None,
+                 on_finish: Optional[Callable[[CompressionStats], None]] = None,
+                 workers: Optional[int] = None):
+        """
+        Initialize parallel ZIP stream
+
+        Args:
+            files: Iterable of (full_path, arcname) tuples
+            chunk_size: Approximate size of yielded chunks
+            policy: Per-file compression policy (default: deflate level 6)
+            on_finish: Called with the compression stats once the archive is complete
+            workers: Compression threads (default: CPU count)
+        """
+        super().__init__(files, chunk_size, policy, on_finish)
+        self.workers = workers or os.cpu_count() or 1
+
+    def _plan(self):
+        """
+        Decide how each file is stored and split it into chunks
+
+        Yields:
+            tuple: (full_path, zinfo, category, chunk_index, chunk_count, offset, length, level)
+        """
+        for full_path, arcname in self.files:
+            try:
+                zinfo = zipfile.ZipInfo.from_file(full_path, arcname)
+                with open(full_path, 'rb') as f:
+                    head = f.read(PROBE_SIZE)
+            except OSError:
+                # Skip files that can't be accessed
+                continue
+
+            category, deflate = self.policy.choose(arcname, head)
+            level = self.policy.level if deflate else 0
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo._compresslevel = level
+
+            count = max(1, -(-zinfo.file_size // PARALLEL_CHUNK_SIZE))
+            for index in range(count):
+                yield (full_path, zinfo, category, index, count,
+                       index * PARALLEL_CHUNK_SIZE, PARALLEL_CHUNK_SIZE, level)
+
+    def __iter__(self) -> Iterator[bytes]:
+        sink = _ChunkSink()
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        jobs = self._plan()
+        window = deque()
+        # Enough queued chunks to keep every worker busy, bounded memory
+        max_pending = self.workers * 4
+
+        def fill():
+            while len(window) < max_pending:
+                job = next(jobs, None)
+                if job is None:
+                    return
+                full_path, _, _, index, count, offset, length, level = job
+                window.append((job, pool.submit(_read_chunk, full_path, offset, length, level,
+                                                index == count - 1)))
+
+        try:
+            with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                dest = None
+                skipped = None
+                tail = b''
+                fill()
+                while window:
+                    (full_path, zinfo, category, index, count, _, _, level), future = window.popleft()
+                    fill()
+                    if zinfo is skipped:
+                        continue
+
+                    try:
+                        raw, zdict, data = future.result()
+                    except OSError:
+                        if index:
+                            raise
+                        # Vanished since it was planned
+                        skipped = zinfo
+                        continue
+
+                    if index == 0:
+                        dest = zip_file.open(zinfo, 'w')
+                        dest._compressor = _Precompressed()
+                        tail = b''
+
+                    if level and zdict != tail:
+                        # The file changed between chunk reads, recompress against what was written
+                        data = _deflate(raw, level, tail, index == count - 1)
+                    dest._compressor.data = data
+                    tail = (tail + raw)[-DEFLATE_WINDOW:] if level else b''
+                    dest.write(raw)
+
+                    if index == count - 1:
+                        dest.close()
+                        dest = None
+                        self.stats.add(category, zinfo.file_size, zinfo.compress_size)
+                    if sink.pending >= self.chunk_size:
+                        yield sink.drain()
+
+            # Central directory is written when the archive is closed
+            if sink.pending:
+                yield sink.drain()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        if self.on_finish:
+            self.on_finish(self.stats)
+
+
+_DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+_ARCHIVE_END_SIGNATURES = (zipfile.stringCentralDir, zipfile.stringEndArchive, zipfile.stringEndArchive64)
+
+
+class _PushbackReader:
+    """Reader over a binary stream that can give back bytes read past the end of an entry"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = b''
+
+    def read(self, size: int) -> bytes:
+        """Up to ``size`` bytes, b'' at the end of the stream"""
+        if self.buffer:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+            return data
+        return self.stream.read(size)
+
+    def read_exact(self, size: int) -> bytes:
+        parts = []
+        while size > 0:
+            data = self.read(size)
+            if not data:
+                raise EOFError("ZIP 数据流提前结束")
+            parts.append(data)
+            size -= len(data)
+        return b''.join(parts)
+
+    def unread(self, data: bytes):
+        self.buffer = data + self.buffer
+
+
+def _zip64_values(extra: bytes) -> Optional[List[int]]:
+    """Values of the ZIP64 extra field of a local header, None if it has none"""
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack('<HH', extra[offset:offset + 4])
+        if header_id == 0x0001:
+            data = extra[offset + 4:offset + 4 + length]
+            return list(struct.unpack(f'<{len(data) // 8}Q', data[:len(data) // 8 * 8]))
+        offset += 4 + length
+    return None
+
+
+def _entry_data(reader: _PushbackReader, zinfo: zipfile.ZipInfo, zip64: bool,
+                chunk_size: int) -> Iterator[bytes]:
+    """Uncompressed data of one entry, checked against its CRC and size"""
+    has_descriptor = zinfo.flag_bits & 0x08
+    crc = 0
+    size = 0
+
+    if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-15)
+        remaining = None if has_descriptor else zinfo.compress_size
+        while not decompressor.eof:
+            data = reader.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not data:
+                raise EOFError("ZIP 数据流提前结束")
+            if remaining is not None:
+                remaining -= len(data)
+            data = decompressor.decompress(data)
+            if data:
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                yield data
+        reader.unread(decompressor.unused_data)
+    elif zinfo.compress_type == zipfile.ZIP_STORED and not has_descriptor:
+        remaining = zinfo.compress_size
+        while remaining > 0:
+            data = reader.read(min(chunk_size, remaining))
+            if not data:
+                raise EOFError("ZIP 数据流提前结束")
+            remaining -= len(data)
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            yield data
+    else:
+        # Stored data of unknown length can only be delimited with the central directory
+        raise ValueError(f"ZIP 条目无法流式解压: {zinfo.filename}")
+
+    if has_descriptor:
+        data = reader.read_exact(4)
+        if data == _DATA_DESCRIPTOR_SIGNATURE:
+            data = reader.read_exact(4)
+        rest = reader.read_exact(16 if zip64 else 8)
+        zinfo.CRC = struct.unpack('<L', data)[0]
+        zinfo.compress_size, zinfo.file_size = struct.unpack('<QQ' if zip64 else '<LL', rest)
+
+    if crc != zinfo.CRC or size != zinfo.file_size:
+        raise zipfile.BadZipFile(f"ZIP 条目校验失败: {zinfo.filename}")
+
+
+def iter_zip_stream(stream, chunk_size: int = 64 * 1024) -> Iterator[Tuple[zipfile.ZipInfo, Iterator[bytes]]]:
+    """
+    Read a ZIP archive front to back from an unseekable stream
+
+    Entries are found through their local headers, so extraction can start
+    with the first bytes. This needs every entry to be delimited without the
+    central directory: by the sizes in its local header, or by the end of its
+    deflate stream, which covers every archive ZipStream writes. A stored
+    entry with a data descriptor raises ValueError.
+
+    Args:
+        stream: Readable binary stream (e.g. the raw HTTP response)
+        chunk_size: Read size
+
+    Yields:
+        tuple: (ZipInfo, iterator of the entry's uncompressed data); the data
+        is checked against the CRC once fully read, unread data is skipped
+    """
+    reader = _PushbackReader(stream)
+    while True:
+        signature = reader.read_exact(4)
+        if signature in _ARCHIVE_END_SIGNATURES:
+            return
+        if signature != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile("ZIP 条目头无效")
+
+        header = struct.unpack(zipfile.structFileHeader,
+                               signature + reader.read_exact(zipfile.sizeFileHeader - 4))
+        (_, _, _, flag_bits, compress_type, dos_time, dos_date, crc,
+         compress_size, file_size, name_length, extra_length) = header
+        name = reader.read_exact(name_length)
+        extra = reader.read_exact(extra_length)
+        if flag_bits & 0x01:
+            raise ValueError("不支持加密的 ZIP 条目")
+
+        name = name.decode('utf-8' if flag_bits & 0x800 else 'cp437')
+        date_time = ((dos_date >> 9) + 1980, (dos_date >> 5) & 0xF, dos_date & 0x1F,
+                     dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2)
+        zinfo = zipfile.ZipInfo(name, date_time)
+        zinfo.flag_bits = flag_bits
+        zinfo.compress_type = compress_type
+        zinfo.CRC = crc
+        zip64 = _zip64_values(extra)
+        if zip64:
+            # Only the saturated 32-bit fields are repeated, in this order
+            if file_size == 0xFFFFFFFF:
+                file_size = zip64.pop(0)
+            if compress_size == 0xFFFFFFFF and zip64:
+                compress_size = zip64.pop(0)
+        zinfo.file_size = file_size
+        zinfo.compress_size = compress_size
+
+        data = _entry_data(reader, zinfo, zip64 is not None, chunk_size)
+        yield zinfo, data
+        for _ in data:
+            pass
+
+
+def zip_entry_mtime(zinfo: zipfile.ZipInfo) -> float:
+    """Modification time of an entry (local time, as written by ZipInfo.from_file)"""
+    return time.mktime(zinfo.date_time + (0, 0, -1))